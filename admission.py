@@ -0,0 +1,224 @@
+import asyncio
+import contextvars
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Priority classes, served in this order
+PRIORITIES = (INTERACTIVE, BATCH)
+
+ANONYMOUS = "anonymous"
+
+# Who the Gemini calls of the current request or job are made for, and at which priority
+_identity = contextvars.ContextVar("admission_identity", default=(ANONYMOUS, INTERACTIVE))
+
+
+def current_identity():
+    """``(client, priority)`` of the request or job being handled"""
+    return _identity.get()
+
+
+@contextmanager
+def identity(client, priority=INTERACTIVE):
+    """Make the Gemini calls in the block count against ``client`` at ``priority``"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority}")
+    token = _identity.set((client or ANONYMOUS, priority))
+    try:
+        yield
+    finally:
+        _identity.reset(token)
+
+
+def seconds_until_midnight():
+    now = datetime.now()
+    return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+
+
+class AdmissionRejected(Exception):
+    """A call that doesn't fit the budget; ``retry_after`` is when trying again makes sense, in seconds"""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted call; ``settle`` replaces its estimate with the tokens it actually used"""
+
+    def __init__(self, entry):
+        self._entry = entry
+
+    @property
+    def tokens(self):
+        return self._entry[1]
+
+    def settle(self, tokens):
+        self._entry[1] = tokens
+
+
+class _Waiter:
+    def __init__(self, tokens, client, priority, sequence, future):
+        self.tokens = tokens
+        self.client = client
+        self.priority = priority
+        self.sequence = sequence
+        self.future = future
+
+
+class AdmissionController:
+    """Admits Gemini calls against a daily token budget and a per-minute token rate.
+
+    Every call states its estimated tokens up front. One that would take
+    today's usage (``used_today()``, plus calls admitted but not recorded yet)
+    past ``daily_budget`` is rejected at once. Otherwise it runs as soon as the
+    tokens admitted over the last ``window`` seconds leave room for it under
+    ``tokens_per_minute``, and waits in a queue until then, for at most
+    ``max_wait[priority]`` seconds. Interactive calls go before batch calls;
+    among waiters of one priority, the client that used the least of the
+    current window goes first, so one client's heavy documents can't starve
+    everyone else. A call larger than the whole rate runs alone once the
+    window is empty. A budget or rate of 0 means no limit.
+
+    The daily budget is shared by all worker processes through the token
+    ledger; the rate window belongs to this process.
+    """
+
+    def __init__(self, daily_budget, tokens_per_minute, used_today, max_wait=None, window=60.0, clock=time.monotonic):
+        self.daily_budget = daily_budget
+        self.tokens_per_minute = tokens_per_minute
+        self.used_today = used_today
+        self.max_wait = max_wait or {INTERACTIVE: 30.0, BATCH: 600.0}
+        self.window = window
+        self.clock = clock
+        self._reserved = 0
+        # [admitted_at, tokens, client] of every call admitted within the window, oldest first
+        self._admitted = deque()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self.counts = {"admitted": 0, "queued": 0, "rejected_budget": 0, "rejected_rate": 0}
+
+    def remaining_today(self):
+        """Tokens left in today's budget (None without a budget)"""
+        if not self.daily_budget:
+            return None
+        return max(0, self.daily_budget - self.used_today() - self._reserved)
+
+    def check_budget(self, tokens):
+        """Raise AdmissionRejected if ``tokens`` more would go over today's budget"""
+        remaining = self.remaining_today()
+        if remaining is not None and tokens > remaining:
+            self.counts["rejected_budget"] += 1
+            raise AdmissionRejected(
+                f"❌ Daily Gemini token budget of {self.daily_budget:,} tokens reached "
+                f"(this request needs about {tokens:,}, {remaining:,} left). Try again tomorrow.",
+                "daily_budget",
+                seconds_until_midnight()
+            )
+
+    @asynccontextmanager
+    async def admit(self, tokens, client=None, priority=None):
+        """Wait until a call of about ``tokens`` tokens may run, and yield its Ticket while it runs"""
+        default_client, default_priority = current_identity()
+        client = client or default_client
+        priority = priority or default_priority
+        tokens = max(1, int(tokens))
+
+        self.check_budget(tokens)
+        self._reserved += tokens
+        try:
+            entry = await self._wait_for_rate(tokens, client, priority)
+            self.counts["admitted"] += 1
+            yield Ticket(entry)
+        finally:
+            self._reserved -= tokens
+            # The call may have used fewer tokens than estimated
+            self._dispatch()
+
+    async def _wait_for_rate(self, tokens, client, priority):
+        self._expire(self.clock())
+        if not self._waiters and self._fits(tokens):
+            return self._charge(tokens, client)
+
+        waiter = _Waiter(tokens, client, priority, next(self._sequence), asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self.counts["queued"] += 1
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(waiter.future, self.max_wait[priority])
+        except asyncio.TimeoutError:
+            self.counts["rejected_rate"] += 1
+            raise AdmissionRejected(
+                f"❌ Gemini is busy: waited {self.max_wait[priority]:g}s for {tokens:,} tokens "
+                f"of the {self.tokens_per_minute:,} tokens per minute allowed. Try again shortly.",
+                "rate",
+                self.window
+            ) from None
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            # The queue head may have changed
+            self._dispatch()
+
+    def _expire(self, now):
+        while self._admitted and self._admitted[0][0] <= now - self.window:
+            self._admitted.popleft()
+
+    def _window_tokens(self):
+        return sum(entry[1] for entry in self._admitted)
+
+    def _fits(self, tokens):
+        if not self.tokens_per_minute:
+            return True
+        used = self._window_tokens()
+        return used == 0 or used + tokens <= self.tokens_per_minute
+
+    def _charge(self, tokens, client):
+        entry = [self.clock(), tokens, client]
+        self._admitted.append(entry)
+        return entry
+
+    def _dispatch(self):
+        """Admit waiters in order while they fit, and wake up again when the window moves on"""
+        now = self.clock()
+        self._expire(now)
+        while self._waiters:
+            by_client = {}
+            for _, tokens, client in self._admitted:
+                by_client[client] = by_client.get(client, 0) + tokens
+            waiter = min(
+                self._waiters,
+                key=lambda w: (PRIORITIES.index(w.priority), by_client.get(w.client, 0), w.sequence)
+            )
+            # The head waits even if a smaller call behind it would fit, so large calls aren't starved
+            if not self._fits(waiter.tokens):
+                break
+            self._waiters.remove(waiter)
+            if not waiter.future.done():
+                waiter.future.set_result(self._charge(waiter.tokens, waiter.client))
+
+        if self._waiters and self._admitted and self._timer is None:
+            delay = max(0.0, self._admitted[0][0] + self.window - now)
+            self._timer = asyncio.get_running_loop().call_later(delay + 0.001, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def stats(self):
+        self._expire(self.clock())
+        return {
+            **self.counts,
+            "daily_budget": self.daily_budget or None,
+            "remaining_today": self.remaining_today(),
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "tokens_last_minute": self._window_tokens(),
+            "waiting": len(self._waiters),
+        }
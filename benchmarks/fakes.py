@@ -0,0 +1,172 @@
+"""Local stand-ins for genai.Client and gTTS used by the benchmarks.
+
+Both simulate latency, token usage and failures without touching the network,
+so benchmark runs are repeatable and free.
+"""
+import asyncio
+import random
+import re
+import time
+
+from google.genai import errors
+
+SUMMARY_SENTENCE = (
+    "The authors describe how the proposed method works and why it improves on earlier approaches. "
+)
+
+
+class FakeUsage:
+    def __init__(self, input_tokens, output_tokens):
+        self.prompt_token_count = input_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = input_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text, input_tokens, output_tokens):
+        self.text = text
+        self.usage_metadata = FakeUsage(input_tokens, output_tokens)
+
+
+class FakeTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class FakeGemini:
+    """Answers generate_content calls like Gemini would for this app's prompts.
+
+    ``latency`` is the mean seconds per call (jittered by ±``jitter``),
+    ``failure_rate`` the fraction of calls that raise a 503, and
+    ``summary_words`` the length of generated summaries. Streamed answers
+    arrive in ``stream_chunks`` pieces spread over the call's latency.
+    """
+
+    def __init__(self, latency=1.0, jitter=0.2, failure_rate=0.0, summary_words=600, tokens_per_byte=0.25,
+                 stream_chunks=20):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.summary_words = summary_words
+        self.tokens_per_byte = tokens_per_byte
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self.failures = 0
+
+    def _delay(self):
+        return max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _input_size(self, contents):
+        size = 0
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, str):
+                size += len(part.encode())
+            else:
+                inline = getattr(part, "inline_data", None)
+                size += len(inline.data) if inline is not None and inline.data else 0
+        return size
+
+    def respond(self, contents):
+        self.calls += 1
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            raise errors.ServerError(503, {"error": {"code": 503, "message": "fake overload", "status": "UNAVAILABLE"}})
+
+        prompt = " ".join(part for part in (contents if isinstance(contents, list) else [contents]) if isinstance(part, str))
+        if "research paper or not" in prompt:
+            text = "YES"
+        else:
+            sentences = max(1, self.summary_words // len(SUMMARY_SENTENCE.split()))
+            paragraphs = [SUMMARY_SENTENCE * 4] * max(1, sentences // 4)
+            text = "\n\n".join(paragraphs)
+
+        input_tokens = int(self._input_size(contents) * self.tokens_per_byte)
+        output_tokens = int(len(text.split()) * 1.3)
+        return FakeResponse(text, input_tokens, output_tokens)
+
+
+class _SyncModels:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def generate_content(self, model, contents, config=None, **kwargs):
+        time.sleep(self._fake._delay())
+        return self._fake.respond(contents)
+
+
+class _AsyncModels:
+    def __init__(self, fake):
+        self._fake = fake
+
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        await asyncio.sleep(self._fake._delay())
+        return self._fake.respond(contents)
+
+    async def count_tokens(self, model, contents, config=None, **kwargs):
+        return FakeTokenCount(int(self._fake._input_size(contents) * self._fake.tokens_per_byte))
+
+    async def generate_content_stream(self, model, contents, config=None, **kwargs):
+        # The first chunk arrives after a tenth of the call's latency, the rest spread over the remainder
+        delay = self._fake._delay()
+        await asyncio.sleep(delay * 0.1)
+        response = self._fake.respond(contents)
+        usage = response.usage_metadata
+        pieces = [piece for piece in re.split(r'(?<=\s)', response.text)]
+        step = max(1, len(pieces) // self._fake.stream_chunks)
+        batches = ["".join(pieces[start:start + step]) for start in range(0, len(pieces), step)]
+
+        async def chunks():
+            produced = 0
+            for index, text in enumerate(batches):
+                if index:
+                    await asyncio.sleep(delay * 0.9 / len(batches))
+                produced += len(text.split())
+                output_tokens = usage.candidates_token_count if index == len(batches) - 1 else int(produced * 1.3)
+                yield FakeResponse(text, usage.prompt_token_count, output_tokens)
+
+        return chunks()
+
+
+class _Aio:
+    def __init__(self, fake):
+        self.models = _AsyncModels(fake)
+
+
+class FakeGenaiClient:
+    """Drop-in replacement for ``genai.Client`` backed by FakeGemini"""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.models = _SyncModels(fake)
+        self.aio = _Aio(fake)
+
+
+# Smallest valid MPEG-1 Layer III frame header (32 kbps, 22.05 kHz, mono), padded to frame length
+_FRAME = b"\xff\xf3\x14\xc4" + b"\x00" * 140
+
+
+def make_fake_gtts(latency_per_100_chars=0.3, failure_rate=0.0):
+    """Build a gTTS stand-in class with the given latency and failure rate.
+
+    Like gTTS it pays one round trip per ~100 characters of text and writes
+    roughly one MP3 frame per 15 characters.
+    """
+
+    class FakeGTTS:
+        calls = 0
+
+        def __init__(self, text, lang="en", slow=False, **kwargs):
+            self.text = text
+
+        def write_to_fp(self, fp):
+            FakeGTTS.calls += 1
+            if random.random() < failure_rate:
+                raise RuntimeError("fake gTTS failure")
+            time.sleep(latency_per_100_chars * max(1, len(self.text) / 100))
+            fp.write(_FRAME * max(1, len(self.text) // 15))
+
+        def save(self, path):
+            with open(path, "wb") as f:
+                self.write_to_fp(f)
+
+    return FakeGTTS
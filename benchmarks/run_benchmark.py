@@ -0,0 +1,266 @@
+"""End-to-end benchmark of the API against fake Gemini and gTTS backends.
+
+Starts the FastAPI app in-process on a local port with ``genai.Client`` and
+``gTTS`` replaced by the stand-ins in benchmarks/fakes.py, uploads corpora of
+synthetic PDFs of different sizes and drives each endpoint at the requested
+concurrency. Latency percentiles, throughput and peak RSS are printed and
+saved as JSON so runs can be compared across commits:
+
+    python benchmarks/run_benchmark.py --sizes 5,50,300 --concurrency 8 --requests 40
+    python benchmarks/run_benchmark.py --compare benchmarks/results/bench-<commit>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeGemini, FakeGenaiClient, make_fake_gtts  # noqa: E402
+from synthetic_pdfs import make_corpus  # noqa: E402
+
+# endpoint name -> (HTTP method, path, whether it takes a document_id)
+ENDPOINTS = {
+    "upload": ("POST", "/uploadfile/", False),
+    "read_pdf": ("GET", "/read_pdf/", True),
+    "analyze_pdf": ("GET", "/analyze_pdf/", True),
+    "summarize_pdf": ("GET", "/summarize_pdf/", True),
+    "summarize_pdf_stream": ("GET", "/summarize_pdf/stream", True),
+    "generate_audio_book": ("GET", "/generate_audio_book/", True),
+    "download_audio_book": ("GET", "/download_audio_book/", True),
+    "token_usage": ("GET", "/token_usage/", False),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated endpoints to drive")
+    parser.add_argument("--sizes", default="5,50", help="comma-separated PDF sizes in pages")
+    parser.add_argument("--docs-per-size", type=int, default=4, help="distinct PDFs per size")
+    parser.add_argument("--image-kb", type=int, default=0, help="size of an uncompressed image added to every page")
+    parser.add_argument("--research", action=argparse.BooleanOptionalAction, default=True,
+                        help="generate research-paper-like PDFs")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--requests", type=int, default=20, help="requests per endpoint and size")
+    parser.add_argument("--cold", action="store_true", help="disable the result cache so every call reaches the fake Gemini")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="mean seconds per fake Gemini call")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0, help="fraction of Gemini calls that fail with 503")
+    parser.add_argument("--tokens-per-byte", type=float, default=0.25, help="input tokens reported per PDF byte")
+    parser.add_argument("--summary-words", type=int, default=600, help="words in each fake summary")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="fake gTTS seconds per 100 characters")
+    parser.add_argument("--tts-failure-rate", type=float, default=0.0, help="fraction of TTS chunks that fail")
+    parser.add_argument("--output", help="where to write the JSON results (default benchmarks/results/bench-<commit>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where it can't be measured (e.g. Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def load_app(args, workdir):
+    """Import the app inside workdir with the fake backends installed"""
+    os.chdir(workdir)
+    os.makedirs("pdf", exist_ok=True)
+    os.makedirs("audio", exist_ok=True)
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    # Measure the pipeline, not the token budget
+    os.environ.setdefault("GEMINI_DAILY_TOKEN_BUDGET", "0")
+    os.environ.setdefault("GEMINI_TOKENS_PER_MINUTE", "0")
+    if args.cold:
+        os.environ["RESULT_CACHE_TTL_SECONDS"] = "0"
+
+    import gtts
+    gtts.gTTS = make_fake_gtts(args.tts_latency, args.tts_failure_rate)
+
+    import main
+    fake = FakeGemini(
+        latency=args.gemini_latency,
+        failure_rate=args.gemini_failure_rate,
+        summary_words=args.summary_words,
+        tokens_per_byte=args.tokens_per_byte
+    )
+    main.gemini.client = FakeGenaiClient(fake)
+    return main, fake
+
+
+def start_server(app):
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def upload_corpus(client, corpus, label):
+    ids = []
+    for index, pdf in enumerate(corpus):
+        response = await client.post(
+            "/uploadfile/", files={"file": (f"{label}_{index}.pdf", pdf, "application/pdf")}
+        )
+        response.raise_for_status()
+        ids.append(response.json()["document_id"])
+    return ids
+
+
+async def drive(client, endpoint, total, concurrency, doc_ids, corpus):
+    """Send ``total`` requests to an endpoint, ``concurrency`` at a time"""
+    method, path, takes_document = ENDPOINTS[endpoint]
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def one(index):
+        nonlocal errors
+        params = {"document_id": doc_ids[index % len(doc_ids)]} if takes_document else None
+        started = time.perf_counter()
+        try:
+            if endpoint == "upload":
+                pdf = corpus[index % len(corpus)]
+                response = await client.post(path, files={"file": (f"upload_{index}.pdf", pdf, "application/pdf")})
+            else:
+                response = await client.request(method, path, params=params)
+            await response.aread()
+            if response.status_code >= 400:
+                errors += 1
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    async def worker():
+        for index in counter:
+            await one(index)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "requests_per_second": round(total / wall, 2) if wall else None,
+    }
+
+
+async def run(args, base_url, fake):
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    endpoints = [name for name in args.endpoints.split(",") if name]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for pages in sizes:
+            corpus = make_corpus(pages, args.docs_per_size, research=args.research, image_kb=args.image_kb)
+            doc_ids = await upload_corpus(client, corpus, f"p{pages}")
+            for endpoint in endpoints:
+                calls_before = fake.calls
+                result = await drive(client, endpoint, args.requests, args.concurrency, doc_ids, corpus)
+                result.update(endpoint=endpoint, pages=pages, gemini_calls=fake.calls - calls_before)
+                results.append(result)
+                print(
+                    f"{endpoint:>22} {pages:>4}p  p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  "
+                    f"p99 {result['p99_ms']:>9.1f} ms  {result['requests_per_second']:>8.2f} req/s  "
+                    f"errors {result['errors']}"
+                )
+    return results
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {(r["endpoint"], r["pages"]): r for r in previous["results"]}
+    print(f"\nCompared with {previous.get('commit', '?')} ({previous_path}):")
+    for result in current["results"]:
+        old = before.get((result["endpoint"], result["pages"]))
+        if not old:
+            continue
+        for metric in ("p50_ms", "p95_ms", "requests_per_second"):
+            change = (result[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{result['endpoint']:>22} {result['pages']:>4}p  {metric:<20} {old[metric]:>10} -> {result[metric]:>10}  ({change:+.1f}%)")
+
+
+def main():
+    args = parse_args()
+    commit = git_commit()
+    output = args.output or os.path.join(REPO_DIR, "benchmarks", "results", f"bench-{commit}.json")
+    output = os.path.abspath(output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory(prefix="pdf-audiobook-bench-") as workdir:
+        app_module, fake = load_app(args, workdir)
+        server, thread, base_url = start_server(app_module.app)
+        try:
+            results = asyncio.run(run(args, base_url, fake))
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "peak_rss_mb": peak_rss_mb(),
+        "fake_gemini_calls": fake.calls,
+        "fake_gemini_failures": fake.failures,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    peak_rss = "unavailable" if report["peak_rss_mb"] is None else f"{report['peak_rss_mb']} MB"
+    print(f"\nPeak RSS {peak_rss}; results saved to {output}")
+
+    if compare_path:
+        compare(report, compare_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Cold-start benchmark: import time of the app and time until it answers its probes.
+
+Each run starts a fresh interpreter, so nothing is cached in the process:
+
+* import: seconds to ``import main`` (measured inside the child process)
+* healthz: seconds from spawning uvicorn until ``/healthz`` returns 200
+* readyz: seconds until ``/readyz`` returns 200
+* warm: seconds until warm-up (heavy imports, Gemini client) has finished
+
+Medians over the runs are printed and saved as JSON so they can be compared
+across commits. No network access is needed: the Gemini client is only
+built, never called.
+
+    python benchmarks/startup_benchmark.py --runs 5
+    python benchmarks/startup_benchmark.py --compare benchmarks/results/startup-<commit>.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import sys, time; sys.path.insert(0, {repo!r}); started = time.perf_counter(); "
+    "import main; print(time.perf_counter() - started)"
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the server to become ready")
+    parser.add_argument("--output", help="where to write the JSON results (default benchmarks/results/startup-<commit>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(workdir):
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(repo=REPO_DIR)],
+        cwd=workdir, env=child_env(), text=True, stderr=subprocess.DEVNULL
+    )
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_server(workdir, timeout):
+    """Spawn uvicorn and poll the probes; returns seconds until healthz, readyz and warm-up"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    times = {"healthz": None, "readyz": None, "warm": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while None in times.values() and time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited with {process.returncode}")
+                try:
+                    if times["healthz"] is None and client.get("/healthz").status_code == 200:
+                        times["healthz"] = time.perf_counter() - started
+                    if times["healthz"] is not None:
+                        response = client.get("/readyz")
+                        if times["readyz"] is None and response.status_code == 200:
+                            times["readyz"] = time.perf_counter() - started
+                        if times["warm"] is None and response.json()["checks"]["warm_up"]["status"] == "done":
+                            times["warm"] = time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return times
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous.get('commit', '?')} ({previous_path}):")
+    for name, result in current["results"].items():
+        old = previous["results"].get(name)
+        if not result or not old:
+            continue
+        change = (result["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+        print(f"{name:>8}  median {old['median_ms']:>8} ms -> {result['median_ms']:>8} ms  ({change:+.1f}%)")
+
+
+def main():
+    args = parse_args()
+    commit = git_commit()
+    output = os.path.abspath(args.output or os.path.join(REPO_DIR, "benchmarks", "results", f"startup-{commit}.json"))
+
+    samples = {"import": [], "healthz": [], "readyz": [], "warm": []}
+    for run in range(args.runs):
+        # A fresh working directory per run, so the app starts with empty databases and folders
+        with tempfile.TemporaryDirectory(prefix="pdf-audiobook-startup-") as workdir:
+            os.makedirs(os.path.join(workdir, "pdf"))
+            os.makedirs(os.path.join(workdir, "audio"))
+            samples["import"].append(measure_import(workdir))
+            for name, value in measure_server(workdir, args.timeout).items():
+                samples[name].append(value)
+        print(
+            f"run {run + 1}: import {samples['import'][-1] * 1000:.0f} ms, "
+            + ", ".join(
+                f"{name} {samples[name][-1] * 1000:.0f} ms" if samples[name][-1] is not None else f"{name} timed out"
+                for name in ("healthz", "readyz", "warm")
+            )
+        )
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "results": {name: summarize(values) for name, values in samples.items()},
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("\n" + "\n".join(
+        f"{name:>8}  median {result['median_ms']:>8} ms" if result else f"{name:>8}  no successful runs"
+        for name, result in report["results"].items()
+    ))
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
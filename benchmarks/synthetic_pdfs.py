@@ -0,0 +1,96 @@
+"""Generate synthetic PDFs of a given size for benchmarks.
+
+The PDFs are built by hand (no extra dependencies) with one text stream per
+page. Research-paper corpora get an Abstract, section headings, citations and
+a References section so they look like papers to the local classifier.
+"""
+import random
+
+WORDS = (
+    "model data results method analysis training network performance signal energy sample "
+    "experiment measurement system approach parameter distribution error baseline evaluation"
+).split()
+
+SECTIONS = ["1 Introduction", "2 Related Work", "3 Methods", "4 Results", "5 Discussion", "6 Conclusion"]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(page, pages, words_per_page, research, rng):
+    lines = []
+    if research and page == 0:
+        lines += ["A Synthetic Study of Benchmark Documents", "Abstract"]
+    if research and pages > 1:
+        section_index = page * len(SECTIONS) // pages
+        lines.append(SECTIONS[section_index])
+    elif research:
+        lines += SECTIONS
+
+    words = [rng.choice(WORDS) for _ in range(words_per_page)]
+    for start in range(0, len(words), 12):
+        line = " ".join(words[start:start + 12])
+        if research and start % 48 == 0:
+            line += f" [{rng.randint(1, 40)}]"
+        lines.append(line)
+
+    if research and page == pages - 1:
+        lines.append("References")
+        lines += [f"[{i}] A. Author. Paper {i}. doi:10.1234/bench.{i}" for i in range(1, 11)]
+    return lines
+
+
+def make_pdf(pages, words_per_page=400, research=True, seed=0, image_kb=0):
+    """Return the bytes of a PDF with the given number of pages of text.
+
+    With ``image_kb`` every page also shows an uncompressed grayscale image of
+    about that size, like the figures and bitmaps of an image-heavy paper.
+    """
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = font + (3 if image_kb else 2) * pages + 1
+    page_ids = []
+    for page in range(pages):
+        lines = _page_lines(page, pages, words_per_page, research, rng)
+        text = "BT /F1 9 Tf 40 760 Td 11 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        resources = b"/Font << /F1 %d 0 R >>" % font
+        if image_kb:
+            height = max(1, image_kb * 1024 // 256)
+            pixels = rng.randbytes(256 * height)
+            image = add(
+                b"<< /Type /XObject /Subtype /Image /Width 256 /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (height, len(pixels)) + pixels + b"\nendstream"
+            )
+            resources += b" /XObject << /Im1 %d 0 R >>" % image
+            text += " q 200 0 0 150 380 40 cm /Im1 Do Q"
+        stream = text.encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << %s >> >>" % (pages_id, content, resources)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), pages))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def make_corpus(pages, count, research=True, words_per_page=400, image_kb=0):
+    """``count`` distinct PDFs of ``pages`` pages each"""
+    return [make_pdf(pages, words_per_page, research, seed=seed, image_kb=image_kb) for seed in range(count)]
@@ -0,0 +1,318 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from db import connect
+
+_SHA256_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+PENDING = "pending"
+RESEARCH_PAPER = "research_paper"
+NOT_RESEARCH_PAPER = "not_research_paper"
+
+
+def audio_filename_for(document_id):
+    """Name of the audio book generated from a document"""
+    return f"audiobook_{document_id}.mp3"
+
+
+class Catalog:
+    """Index of the PDFs in pdf/ and the audio books in audio/, shared by every worker process.
+
+    The index is a SQLite database in WAL mode, so a document uploaded through
+    one worker is at once the latest document for all of them, and analysis
+    results survive restarts. The directories are scanned at startup to pick up
+    files added or removed while the server was down; afterwards uploads and
+    audio generation register their files directly, so finding the latest
+    document or audio book, or looking one up by id, never touches the
+    filesystem. Documents are keyed by id, which is the file name without
+    ``.pdf`` (the SHA-256 of the content for uploads stored by hash).
+    """
+
+    def __init__(self, pdf_dir="pdf", audio_dir="audio", db_path="catalog.db"):
+        self.pdf_dir = pdf_dir
+        self.audio_dir = audio_dir
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._dir_mtimes = {}
+        self.loaded_at = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self._conn = connect(db_path, sqlite3.Row)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                sha256 TEXT,
+                size_bytes INTEGER NOT NULL,
+                uploaded_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                analysis_status TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_uploaded ON documents(uploaded_at)")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS audio (
+                filename TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                document_id TEXT,
+                size_bytes INTEGER NOT NULL,
+                sha256 TEXT,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_created ON audio(created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_document ON audio(document_id, created_at)")
+        self._conn.commit()
+
+    def load(self):
+        """Bring the index in line with the contents of pdf/ and audio/.
+
+        Files already registered keep their metadata, new files are added with
+        their modification time as upload time and entries whose file is gone
+        are dropped.
+        """
+        documents = {}
+        for entry in self._scan(self.pdf_dir):
+            if entry.name.lower().endswith(".pdf"):
+                stat = entry.stat()
+                documents[entry.name[:-len(".pdf")]] = (entry.path, stat.st_size, stat.st_mtime)
+
+        audio_files = {}
+        for entry in self._scan(self.audio_dir):
+            if entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                audio_files[entry.name] = (entry.path, stat.st_size, stat.st_mtime)
+
+        with self._lock, self._transaction():
+            known = {row[0] for row in self._conn.execute("SELECT id FROM documents")}
+            self._conn.executemany(
+                "DELETE FROM documents WHERE id = ?", [(doc_id,) for doc_id in known - documents.keys()]
+            )
+            for doc_id, (path, size, mtime) in sorted(documents.items(), key=lambda item: item[1][2]):
+                if doc_id in known:
+                    self._conn.execute(
+                        "UPDATE documents SET path = ?, size_bytes = ? WHERE id = ?", (path, size, doc_id)
+                    )
+                else:
+                    self._insert_document(path, size=size, uploaded_at=mtime)
+
+            known_audio = {row[0] for row in self._conn.execute("SELECT filename FROM audio")}
+            self._conn.executemany(
+                "DELETE FROM audio WHERE filename = ?", [(name,) for name in known_audio - audio_files.keys()]
+            )
+            for filename, (path, size, mtime) in sorted(audio_files.items(), key=lambda item: item[1][2]):
+                if filename in known_audio:
+                    self._conn.execute(
+                        "UPDATE audio SET path = ?, size_bytes = ? WHERE filename = ?", (path, size, filename)
+                    )
+                else:
+                    self._insert_audio(path, size=size, created_at=mtime)
+            self._dir_mtimes = self._current_dir_mtimes()
+        self.loaded_at = time.time()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so the reads inside see what is written
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+    def _scan(self, directory):
+        try:
+            with os.scandir(directory) as entries:
+                return [entry for entry in entries if entry.is_file()]
+        except FileNotFoundError:
+            return []
+
+    def _insert_document(self, path, sha256=None, size=None, uploaded_at=None, filename=None):
+        doc_id = os.path.basename(path)[:-len(".pdf")]
+        if sha256 is None and _SHA256_NAME.match(doc_id):
+            sha256 = doc_id
+        uploaded_at = uploaded_at or time.time()
+        self._conn.execute("""
+            INSERT INTO documents (id, path, filename, sha256, size_bytes, uploaded_at, accessed_at, analysis_status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                path = excluded.path,
+                filename = COALESCE(?, filename),
+                sha256 = COALESCE(excluded.sha256, sha256),
+                size_bytes = excluded.size_bytes,
+                uploaded_at = excluded.uploaded_at,
+                accessed_at = excluded.accessed_at
+        """, (
+            doc_id, path, filename or os.path.basename(path), sha256,
+            size if size is not None else os.path.getsize(path), uploaded_at, uploaded_at, PENDING, filename
+        ))
+        return doc_id
+
+    def _document(self, row):
+        doc = dict(row)
+        doc["audio"] = [
+            audio_row[0] for audio_row in self._conn.execute(
+                "SELECT filename FROM audio WHERE document_id = ? ORDER BY created_at, rowid", (doc["id"],)
+            )
+        ]
+        return doc
+
+    def add_document(self, path, sha256=None, size=None, filename=None):
+        """Register an uploaded PDF (or re-register an existing one) as the latest document"""
+        with self._lock:
+            with self._conn:
+                doc_id = self._insert_document(path, sha256=sha256, size=size, filename=filename)
+            return self.get(doc_id)
+
+    def remove_document(self, doc_id):
+        """Forget a document (its audio books stay registered)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def touch(self, doc_id=None, audio_file=None):
+        """Record that a document or audio book was just used, for least-recently-accessed eviction"""
+        now = time.time()
+        with self._lock, self._conn:
+            if doc_id is not None:
+                self._conn.execute("UPDATE documents SET accessed_at = ? WHERE id = ?", (now, doc_id))
+            if audio_file is not None:
+                self._conn.execute("UPDATE audio SET accessed_at = ? WHERE filename = ?", (now, audio_file))
+
+    def get(self, doc_id):
+        """Look up a document by id, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            return self._document(row) if row else None
+
+    def latest_document(self):
+        """The most recently uploaded document, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents ORDER BY uploaded_at DESC, rowid DESC LIMIT 1"
+            ).fetchone()
+            return self._document(row) if row else None
+
+    def documents(self):
+        """All documents, newest first"""
+        with self._lock:
+            audio = {}
+            for filename, doc_id in self._conn.execute(
+                "SELECT filename, document_id FROM audio ORDER BY created_at, rowid"
+            ):
+                audio.setdefault(doc_id, []).append(filename)
+            return [
+                {**dict(row), "audio": audio.get(row["id"], [])}
+                for row in self._conn.execute("SELECT * FROM documents ORDER BY uploaded_at DESC, rowid DESC")
+            ]
+
+    def document_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def set_hash(self, doc_id, sha256):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE documents SET sha256 = ? WHERE id = ?", (sha256, doc_id))
+
+    def set_analysis(self, doc_id, status):
+        """Record the classification result for a document"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE documents SET analysis_status = ? WHERE id = ?", (status, doc_id))
+
+    def add_audio(self, path, doc_id=None, sha256=None):
+        """Register a generated audio book as the latest one"""
+        with self._lock:
+            with self._conn:
+                filename = self._insert_audio(path, doc_id=doc_id, sha256=sha256)
+            return self.get_audio(filename)
+
+    def set_audio_hash(self, filename, sha256):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE audio SET sha256 = ? WHERE filename = ?", (sha256, filename))
+
+    def _insert_audio(self, path, doc_id=None, size=None, created_at=None, sha256=None):
+        filename = os.path.basename(path)
+        if doc_id is None and filename.startswith("audiobook_"):
+            doc_id = os.path.splitext(filename)[0][len("audiobook_"):]
+        created_at = created_at or time.time()
+        # REPLACE gives the row a new rowid, so a regenerated book counts as the newest
+        self._conn.execute("""
+            INSERT OR REPLACE INTO audio (filename, path, document_id, size_bytes, sha256, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            filename, path, doc_id, size if size is not None else os.path.getsize(path), sha256, created_at, created_at
+        ))
+        return filename
+
+    def remove_audio(self, filename):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM audio WHERE filename = ?", (filename,))
+
+    def get_audio(self, filename):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM audio WHERE filename = ?", (filename,)).fetchone()
+            return dict(row) if row else None
+
+    def latest_audio(self, doc_id=None):
+        """The most recently generated audio book, optionally for one document"""
+        with self._lock:
+            if doc_id is None:
+                row = self._conn.execute("SELECT * FROM audio ORDER BY created_at DESC, rowid DESC LIMIT 1").fetchone()
+            else:
+                row = self._conn.execute("""
+                    SELECT * FROM audio
+                    WHERE document_id = ? AND EXISTS (SELECT 1 FROM documents WHERE id = ?)
+                    ORDER BY created_at DESC, rowid DESC LIMIT 1
+                """, (doc_id, doc_id)).fetchone()
+            return dict(row) if row else None
+
+    def audio_files(self):
+        """All audio books, newest first"""
+        with self._lock:
+            return [
+                dict(row) for row in self._conn.execute("SELECT * FROM audio ORDER BY created_at DESC, rowid DESC")
+            ]
+
+    def _current_dir_mtimes(self):
+        mtimes = {}
+        for directory in (self.pdf_dir, self.audio_dir):
+            try:
+                mtimes[directory] = os.stat(directory).st_mtime
+            except FileNotFoundError:
+                mtimes[directory] = None
+        return mtimes
+
+    def refresh_if_changed(self):
+        """Rescan the directories if files were added or removed behind the catalog's back"""
+        if self._current_dir_mtimes() != self._dir_mtimes:
+            self.load()
+            return True
+        return False
+
+    def start_watching(self, interval):
+        """Poll the directories every interval seconds for changes made outside the API"""
+        if self._watcher or interval <= 0:
+            return
+        self._stop_watching.clear()
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.refresh_if_changed()
+                except Exception as e:
+                    print(f"⚠️ Error refreshing catalog: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher:
+            self._stop_watching.set()
+            self._watcher.join(timeout=1)
+            self._watcher = None
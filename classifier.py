@@ -0,0 +1,76 @@
+import re
+
+ABSTRACT_HEADING = re.compile(r'^\s*(\d+\.?\s*)?abstract\b', re.IGNORECASE | re.MULTILINE)
+REFERENCES_HEADING = re.compile(
+    r'^\s*(\d+\.?\s*)?(references|bibliography|works cited|literature cited)\s*$', re.IGNORECASE | re.MULTILINE
+)
+DOI = re.compile(r'\b10\.\d{4,9}/[^\s"<>]+')
+ARXIV_ID = re.compile(r'\barXiv:\s*\d{4}\.\d{4,5}(v\d+)?', re.IGNORECASE)
+NUMBERED_CITATION = re.compile(r'\[\d+(\s*[,–-]\s*\d+)*\]')
+AUTHOR_YEAR_CITATION = re.compile(r'\(([A-Z][A-Za-z\-]+( et al\.)?,? (19|20)\d{2}[a-z]?;?\s*)+\)')
+SECTION_HEADINGS = {
+    "introduction": re.compile(r'^\s*(\d+\.?\s*)?introduction\s*$', re.IGNORECASE | re.MULTILINE),
+    "related_work": re.compile(r'^\s*(\d+\.?\s*)?(related work|background|literature review)\s*$', re.IGNORECASE | re.MULTILINE),
+    "methods": re.compile(r'^\s*(\d+\.?\s*)?(methods?|methodology|materials and methods|experimental setup)\s*$', re.IGNORECASE | re.MULTILINE),
+    "results": re.compile(r'^\s*(\d+\.?\s*)?(results|experiments|evaluation)\s*$', re.IGNORECASE | re.MULTILINE),
+    "discussion": re.compile(r'^\s*(\d+\.?\s*)?discussion\s*$', re.IGNORECASE | re.MULTILINE),
+    "conclusion": re.compile(r'^\s*(\d+\.?\s*)?(conclusions?|concluding remarks)\s*$', re.IGNORECASE | re.MULTILINE),
+}
+
+# Weight of each signal; a score of 1.0 is reached at MAX_SCORE points
+WEIGHTS = {
+    "abstract": 2.0,
+    "references": 2.0,
+    "doi": 1.0,
+    "arxiv": 1.5,
+    "citations": 1.5,
+    "sections": 2.0,
+}
+MAX_SCORE = 6.0
+# Bump when the signals or their scoring change, so cached scores are recomputed
+VERSION = 2
+MIN_TEXT_CHARS = 500
+
+
+def score_research_paper(first_pages, last_pages):
+    """Score how much extracted text looks like a research paper.
+
+    ``first_pages`` and ``last_pages`` are the text of the opening and closing
+    pages. Returns ``(score, signals)`` where score is between 0 and 1 and
+    signals records what was found. Returns a score of None when there is too
+    little text to judge (e.g. a scanned PDF).
+    """
+    text = f"{first_pages}\n{last_pages}"
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        return None, {"text_chars": len(text.strip())}
+
+    citations = len(NUMBERED_CITATION.findall(text)) + len(AUTHOR_YEAR_CITATION.findall(text))
+    sections = [name for name, pattern in SECTION_HEADINGS.items() if pattern.search(text)]
+    signals = {
+        "abstract": bool(ABSTRACT_HEADING.search(first_pages)),
+        "references": bool(REFERENCES_HEADING.search(last_pages) or REFERENCES_HEADING.search(first_pages)),
+        "doi": bool(DOI.search(text)),
+        "arxiv": bool(ARXIV_ID.search(text)),
+        "citations": citations,
+        "sections": sections,
+    }
+
+    points = 0.0
+    for name in ("abstract", "references", "doi", "arxiv"):
+        if signals[name]:
+            points += WEIGHTS[name]
+    points += WEIGHTS["citations"] * min(1.0, citations / 5)
+    points += WEIGHTS["sections"] * min(1.0, len(sections) / 3)
+
+    return round(min(1.0, points / MAX_SCORE), 3), signals
+
+
+def decide(score, yes_threshold, no_threshold):
+    """Turn a heuristic score into True/False, or None when it is too close to call"""
+    if score is None:
+        return None
+    if score >= yes_threshold:
+        return True
+    if score <= no_threshold:
+        return False
+    return None
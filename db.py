@@ -0,0 +1,19 @@
+import sqlite3
+
+# How long a connection waits for another process's write transaction before giving up
+BUSY_TIMEOUT_SECONDS = 30.0
+
+
+def connect(db_path, row_factory=None):
+    """Open a SQLite database that the threads of this process and other worker processes share.
+
+    WAL mode lets readers carry on while one connection writes, and the busy
+    timeout makes a writer wait for another process's transaction instead of
+    failing with "database is locked".
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    return conn
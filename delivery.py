@@ -0,0 +1,148 @@
+import hashlib
+import os
+from email.utils import formatdate
+
+import anyio
+from starlette.responses import Response
+
+CHUNK_SIZE = 256 * 1024
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RangeNotSatisfiable(Exception):
+    """The Range header doesn't overlap the file"""
+
+
+def parse_range(header, size):
+    """Turn a ``Range`` header into an inclusive ``(start, end)`` byte range.
+
+    Returns None when the whole file should be sent: no header, a unit other
+    than bytes, a malformed value, or several ranges (which may be ignored
+    rather than answered with multipart/byteranges). Raises RangeNotSatisfiable
+    when the range starts past the end of the file.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    first, last = (part.strip() for part in spec.split("-", 1))
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(header, etag):
+    """Whether an ``If-None-Match`` header matches etag (weak comparison)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class RangeFileResponse(Response):
+    """Send ``start``..``end`` (inclusive) of a file.
+
+    Uses the ASGI zero-copy send extension (sendfile) when the server offers
+    it, otherwise reads the range in chunks off the event loop.
+    """
+
+    def __init__(self, path, start, end, status_code=200, headers=None, media_type=None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        length = self.end - self.start + 1
+        if scope["method"].upper() == "HEAD" or length <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": length,
+                    "more_body": False
+                })
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank underneath us; end the response rather than hang
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def file_response(request_headers, path, sha256, media_type, headers=None):
+    """Serve a file with a strong ETag, conditional GET and byte ranges.
+
+    Returns 304 when ``If-None-Match`` matches, 206 for a satisfiable ``Range``
+    (honouring ``If-Range``), 416 for an unsatisfiable one and 200 otherwise.
+    """
+    stat = os.stat(path)
+    etag = f'"{sha256}"'
+    validators = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "accept-ranges": "bytes",
+        "cache-control": "no-cache",
+    }
+
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=validators)
+
+    headers = {**validators, **(headers or {})}
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**validators, "content-range": f"bytes */{stat.st_size}"})
+
+    if byte_range is None:
+        return RangeFileResponse(path, 0, stat.st_size - 1, headers=headers, media_type=media_type)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{stat.st_size}"
+    return RangeFileResponse(path, start, end, status_code=206, headers=headers, media_type=media_type)
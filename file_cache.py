@@ -0,0 +1,90 @@
+import os
+import threading
+
+
+class FileCache:
+    """A directory of derived files, kept under ``max_bytes`` by deleting the least recently used.
+
+    A file's lock comes from ``locks`` (a DocumentLocks), in ``namespace``,
+    keyed by its name without the extension, so files that differ only in
+    extension share one. Whoever makes or reads a file holds its lock through
+    ``hold``; concurrent requests for it, in this or another worker process,
+    wait and then reuse the result. Eviction skips files whose lock is held,
+    so a file is never deleted while someone is making or reading it. Names
+    starting with a dot are temporary files and ignored.
+    """
+
+    def __init__(self, directory, max_bytes, locks, namespace):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.locks = locks
+        self.namespace = namespace
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def hold(self, name):
+        """Hold the lock of the file ``name`` while the block runs, blocking this thread until it is free"""
+        return self.locks.hold_blocking(os.path.splitext(name)[0], self.namespace)
+
+    def hold_async(self, name):
+        """Hold the lock of the file ``name`` while the block runs, waiting without blocking the event loop"""
+        return self.locks.hold(os.path.splitext(name)[0], self.namespace)
+
+    def lookup(self, name):
+        """Path of the cached file, marked as just used, or None if it isn't cached; call while holding it"""
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _files(self):
+        """``(mtime, size, name)`` of every cached file"""
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.name))
+        except FileNotFoundError:
+            pass
+        return files
+
+    def evict(self, keep=None):
+        """Delete the least recently used files, except ``keep``, until the rest fit in max_bytes"""
+        with self._lock:
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            for _, size, name in files:
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                with self.locks.hold_if_free(os.path.splitext(name)[0], self.namespace) as free:
+                    if not free:
+                        continue
+                    try:
+                        os.remove(self.path(name))
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                self.evictions += 1
+
+    def usage(self, suffix=""):
+        """Count and bytes of the cached files (those ending in ``suffix`` for the count), with the limit"""
+        files = self._files()
+        return {
+            "files": sum(1 for _, _, name in files if name.endswith(suffix)),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,166 @@
+import asyncio
+import random
+import threading
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    """Whether a failed Gemini call is worth retrying (rate limits, server errors, timeouts)"""
+    # Imported here so importing this module doesn't load the SDK
+    import httpx
+    from google.genai import errors
+
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS or (error.code or 0) >= 500
+    return isinstance(error, (asyncio.TimeoutError, httpx.TransportError))
+
+
+class GeminiGateway:
+    """Async access to Gemini shared by every request.
+
+    Calls go through the client's async API (``client.aio``), which keeps a
+    pool of HTTP connections open. At most ``max_in_flight`` calls run at
+    once; each call is bounded by ``timeout`` seconds and retried on 429, 5xx
+    and timeouts with exponential backoff and full jitter.
+
+    Any object with a ``client.aio.models.generate_content`` coroutine can be
+    passed in, so tests can swap in a fake client or point a real client at a
+    local server through ``GEMINI_BASE_URL``. Instead of a client,
+    ``client_factory`` may be given: it is called (off the event loop) on first
+    use or by ``warm_up``, since building the SDK client means importing it.
+    """
+
+    def __init__(self, client=None, max_in_flight=8, timeout=120.0, max_retries=4, base_delay=1.0, max_delay=30.0,
+                 client_factory=None):
+        self._client = client
+        self.client_factory = client_factory
+        self.client_error = None
+        self._client_lock = threading.Lock()
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = None
+        self._loop = None
+        self.in_flight = 0
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "timeouts": 0}
+
+    @property
+    def client(self):
+        """The client, built by ``client_factory`` the first time it is needed"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        self._client = self.client_factory()
+                        self.client_error = None
+                    except Exception as e:
+                        self.client_error = str(e)
+                        raise
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def client_ready(self):
+        return self._client is not None
+
+    async def warm_up(self):
+        """Build the client in a worker thread so the event loop never waits on the import"""
+        if self._client is None:
+            await asyncio.to_thread(lambda: self.client)
+
+    def _get_semaphore(self):
+        # Semaphores belong to an event loop, so create one per loop the gateway is used from
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._semaphore
+
+    def backoff(self, attempt):
+        """Delay before retry number ``attempt`` (0-based), with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _retry_or_raise(self, error, attempt):
+        """Count a failed attempt, then wait before the next one or re-raise if it shouldn't be retried"""
+        if isinstance(error, asyncio.TimeoutError):
+            self.stats["timeouts"] += 1
+        if attempt == self.max_retries or not is_retryable(error):
+            self.stats["failures"] += 1
+            raise error
+        delay = self.backoff(attempt)
+        self.stats["retries"] += 1
+        print(f"⚠️ Gemini call failed ({error}), retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+        await asyncio.sleep(delay)
+
+    async def generate_content(self, model, contents, config=None):
+        """Call ``generate_content`` with the concurrency cap, timeout and retries applied"""
+        async with self._get_semaphore():
+            self.in_flight += 1
+            try:
+                await self.warm_up()
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self.stats["calls"] += 1
+                        return await asyncio.wait_for(
+                            self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+                            timeout=self.timeout
+                        )
+                    except Exception as e:
+                        await self._retry_or_raise(e, attempt)
+            finally:
+                self.in_flight -= 1
+
+    async def count_tokens(self, model, contents):
+        """Input tokens of ``contents`` according to ``count_tokens``, with the concurrency cap, timeout and retries"""
+        async with self._get_semaphore():
+            await self.warm_up()
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.count_tokens(model=model, contents=contents),
+                        timeout=self.timeout
+                    )
+                    return response.total_tokens
+                except Exception as e:
+                    await self._retry_or_raise(e, attempt)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        """Yield ``generate_content_stream`` chunks with the concurrency cap applied.
+
+        ``timeout`` bounds the wait for each chunk. A call that fails before its
+        first chunk is retried like generate_content; once chunks have been
+        yielded the error is raised, since the caller already has part of the answer.
+        """
+        async with self._get_semaphore():
+            self.in_flight += 1
+            try:
+                await self.warm_up()
+                for attempt in range(self.max_retries + 1):
+                    started = False
+                    try:
+                        self.stats["calls"] += 1
+                        stream = await asyncio.wait_for(
+                            self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config),
+                            timeout=self.timeout
+                        )
+                        chunks = stream.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                            except StopAsyncIteration:
+                                return
+                            started = True
+                            yield chunk
+                    except Exception as e:
+                        if started:
+                            self.stats["failures"] += 1
+                            raise
+                        await self._retry_or_raise(e, attempt)
+            finally:
+                self.in_flight -= 1
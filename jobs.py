@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connect
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobStore:
+    """SQLite-backed record of background jobs so they survive a restart.
+
+    Several worker processes can share one store: a job is claimed by a single
+    worker with a conditional update, and a worker keeps ``heartbeat_at`` of its
+    running jobs fresh so jobs of a worker that died can be handed to another.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect(db_path, sqlite3.Row)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL DEFAULT 0,
+                params TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (("worker", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.commit()
+
+    def create(self, kind, params):
+        """Insert a new queued job and return it"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO jobs (id, kind, status, stage, progress, params, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+            """, (job_id, kind, QUEUED, QUEUED, json.dumps(params), now, now))
+            self._conn.commit()
+        return self.get(job_id)
+
+    def update(self, job_id, **fields):
+        """Update status, stage, progress, result or error of a job"""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it doesn't exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit=50):
+        """Return the most recently created jobs"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, worker):
+        """Mark the oldest queued job as running for ``worker`` and return it, or None if none is queued"""
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at ASC LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                with self._conn:
+                    # Only one worker's update can still see the job as queued
+                    claimed = self._conn.execute("""
+                        UPDATE jobs SET status = ?, stage = ?, worker = ?, heartbeat_at = ?, updated_at = ?
+                        WHERE id = ? AND status = ?
+                    """, (RUNNING, RUNNING, worker, now, now, row["id"], QUEUED)).rowcount
+            if claimed:
+                return self.get(row["id"])
+
+    def heartbeat(self, worker):
+        """Record that ``worker`` is still alive and running its jobs"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND worker = ?", (time.time(), RUNNING, worker)
+            )
+
+    def requeue_stale(self, lease_seconds):
+        """Queue again the running jobs whose worker stopped sending heartbeats; returns how many"""
+        with self._lock, self._conn:
+            return self._conn.execute("""
+                UPDATE jobs SET status = ?, stage = ?, progress = 0, worker = NULL, updated_at = ?
+                WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+            """, (QUEUED, QUEUED, time.time(), RUNNING, time.time() - lease_seconds)).rowcount
+
+    def release(self, worker):
+        """Queue again the jobs ``worker`` is running, e.g. when it shuts down"""
+        with self._lock, self._conn:
+            return self._conn.execute("""
+                UPDATE jobs SET status = ?, stage = ?, progress = 0, worker = NULL, updated_at = ?
+                WHERE status = ? AND worker = ?
+            """, (QUEUED, QUEUED, time.time(), RUNNING, worker)).rowcount
+
+    def count(self, status):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def unfinished(self):
+        """Jobs that were queued or running when the server last stopped"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at ASC", (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobQueue:
+    """Bounded worker pool for background jobs.
+
+    ``handlers`` maps a job kind to ``handler(params, progress)``, which returns a
+    JSON-serializable result; ``progress(stage, fraction, result=None)`` records
+    how far along the job is, optionally with a partial result. Coroutine handlers are awaited by the workers, plain functions run
+    in a thread pool so they don't block the event loop. At most ``workers`` jobs
+    run at the same time.
+
+    The queue is the job store itself, so every server process sharing it
+    takes part: workers claim queued jobs from the store, are woken at once
+    by jobs submitted in their own process and poll every ``poll_interval``
+    seconds for the others'. Running jobs get a heartbeat every third of
+    ``lease_seconds``; a job whose heartbeat is older than that (its process
+    died) is queued again.
+    """
+
+    def __init__(self, store, handlers, workers=2, poll_interval=1.0, lease_seconds=60.0):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = None
+        self._tasks = []
+        self._executor = None
+
+    async def start(self):
+        """Start the workers; jobs of workers that are gone are queued again"""
+        self._wake = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job-worker")
+        requeued = self.store.requeue_stale(self.lease_seconds)
+        if requeued:
+            print(f"🔁 Re-queued {requeued} jobs left over from a previous run")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._keep_alive()))
+
+    async def stop(self):
+        """Stop the workers; their running jobs go back to the queue for the next start or another process"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.release(self.worker_id)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, kind, params):
+        """Persist a new job and wake a worker"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = self.store.create(kind, params)
+        self._wake.set()
+        return job
+
+    def running(self):
+        """Whether the workers are started and none has died"""
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    def pending(self):
+        """Number of jobs waiting for a free worker in any process"""
+        return self.store.count(QUEUED)
+
+    async def _worker(self):
+        while True:
+            job = self.store.claim(self.worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            await self._run(job)
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                self.store.heartbeat(self.worker_id)
+                requeued = self.store.requeue_stale(self.lease_seconds)
+                if requeued:
+                    print(f"🔁 Re-queued {requeued} jobs of a worker that stopped responding")
+                    self._wake.set()
+            except Exception as e:
+                print(f"⚠️ Error renewing job leases: {e}")
+
+    async def _run(self, job):
+        job_id = job["id"]
+        handler = self.handlers[job["kind"]]
+
+        def progress(stage, fraction, result=None):
+            fields = {"stage": stage, "progress": round(fraction, 3), "heartbeat_at": time.time()}
+            if result is not None:
+                fields["result"] = result
+            self.store.update(job_id, **fields)
+
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                result = await handler(job["params"], progress)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, handler, job["params"], progress)
+            self.store.update(job_id, status=COMPLETED, stage=COMPLETED, progress=1.0, result=result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, stage=FAILED, error=str(e))
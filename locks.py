@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class DocumentLocks:
+    """Advisory locks shared by every worker process on the machine.
+
+    A lock is a ``flock`` on a file in ``directory``. Keys are hashed onto
+    ``stripes`` files per namespace so the directory doesn't grow with the
+    number of documents; two keys that share a file merely wait for each other.
+    The OS drops a process's locks when it exits, so a crashed worker never
+    leaves a document locked. Without flock (Windows) exclusive locks only
+    cover this process and shared locks are no-ops.
+    """
+
+    def __init__(self, directory, stripes=1024, poll_interval=0.05):
+        self.directory = directory
+        self.stripes = stripes
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+        self._local_lock = threading.Lock()
+        self._local = {}
+
+    def _path(self, key, namespace):
+        stripe = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) % self.stripes
+        return os.path.join(self.directory, f"{namespace}-{stripe}.lock")
+
+    def _try_acquire(self, path, shared):
+        """A handle to release later, or None if the lock is held elsewhere"""
+        if fcntl is None:
+            if shared:
+                return True
+            with self._local_lock:
+                lock = self._local.setdefault(path, threading.Lock())
+            return lock if lock.acquire(blocking=False) else None
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def _release(handle):
+        if isinstance(handle, int) and not isinstance(handle, bool):
+            # Closing the descriptor releases the flock
+            os.close(handle)
+        elif handle is not True:
+            handle.release()
+
+    @asynccontextmanager
+    async def hold(self, key, namespace="doc", shared=False):
+        """Hold the lock on key while the block runs, waiting without blocking the event loop.
+
+        Several holders may share a ``shared`` lock; an exclusive one waits for
+        every other holder. Acquisition polls, so a cancelled waiter never ends
+        up owning the lock.
+        """
+        path = self._path(key, namespace)
+        delay = 0.001
+        while True:
+            handle = self._try_acquire(path, shared)
+            if handle is not None:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+        try:
+            yield
+        finally:
+            self._release(handle)
+
+    @contextmanager
+    def hold_blocking(self, key, namespace="doc"):
+        """Hold the exclusive lock on key while the block runs, blocking the calling thread until it is free.
+
+        For code that already runs in a worker thread. Every holder opens its
+        own descriptor, so the flock also keeps out other threads of this process.
+        """
+        path = self._path(key, namespace)
+        if fcntl is None:
+            with self._local_lock:
+                lock = self._local.setdefault(path, threading.Lock())
+            with lock:
+                yield
+            return
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            self._release(fd)
+
+    @contextmanager
+    def hold_if_free(self, key, namespace="doc"):
+        """Hold the exclusive lock on key while the block runs if nobody holds it now; yields whether it does"""
+        handle = self._try_acquire(self._path(key, namespace), shared=False)
+        try:
+            yield handle is not None
+        finally:
+            if handle is not None:
+                self._release(handle)
@@ -1,134 +1,235 @@
-from google import genai
-from google.genai import types
 import pathlib
 import os
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager, aclosing
 import uvicorn
 import json
-from gtts import gTTS
-from datetime import datetime, timedelta
-import sqlite3
+import asyncio
+import time
+import queue
+import functools
+from collections import Counter
+from typing import List
+from result_cache import ResultCache, content_hash, prompt_version, make_cache_key
+from jobs import JobStore, JobQueue, QUEUED, RUNNING, COMPLETED, FAILED
+from gemini import GeminiGateway
+from segments import SegmentStore
+from tts import synthesize_to_file, LiveAudio, LiveAudioReader, live_audio_files, ParagraphBuffer, GTTSEngine, espeak_engine, piper_engine
+from uploads import receive_uploads, check_content_length, UploadTooLarge, InvalidUpload
+from token_ledger import TokenLedger
+from pdf_text import page_count, extract_ends, iter_page_ranges
+from classifier import score_research_paper, decide, VERSION as CLASSIFIER_VERSION
+from metrics import Metrics, server_timing
+from delivery import file_response, file_sha256
+from transcode import RenditionCache, TranscodeError, FORMATS, negotiate_format, valid_bitrate
+from storage import StorageManager, Quota
+from locks import DocumentLocks
+from slim import SlimCache
+from singleflight import SingleFlight
+from admission import AdmissionController, AdmissionRejected, identity, current_identity, INTERACTIVE, BATCH
+from catalog import Catalog, audio_filename_for, RESEARCH_PAPER, NOT_RESEARCH_PAPER
 
 # Token tracking database
 TOKEN_DB = "token_usage.db"
+TOKEN_FLUSH_SECONDS = float(os.getenv("TOKEN_FLUSH_SECONDS", "5"))
+TOKEN_FLUSH_THRESHOLD = int(os.getenv("TOKEN_FLUSH_THRESHOLD", "50"))
 
-def init_token_db():
-    """Initialize token tracking database"""
-    conn = sqlite3.connect(TOKEN_DB)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS token_usage (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            input_tokens INTEGER DEFAULT 0,
-            output_tokens INTEGER DEFAULT 0,
-            total_tokens INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+# Gemini result cache (classification and summaries), stored next to the token database
+RESULT_CACHE_DB = "result_cache.db"
+RESULT_CACHE_MEMORY_ENTRIES = int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "256"))
+RESULT_CACHE_DISK_ENTRIES = int(os.getenv("RESULT_CACHE_DISK_ENTRIES", "5000"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
 
-def add_tokens(input_tokens=0, output_tokens=0):
-    """Add token usage to database"""
-    try:
-        conn = sqlite3.connect(TOKEN_DB)
-        cursor = conn.cursor()
-        today = datetime.now().strftime("%Y-%m-%d")
-        total = input_tokens + output_tokens
-        
-        # Check if entry exists for today
-        cursor.execute("SELECT id, input_tokens, output_tokens FROM token_usage WHERE date = ?", (today,))
-        result = cursor.fetchone()
-        
-        if result:
-            row_id, existing_input, existing_output = result
-            cursor.execute("""
-                UPDATE token_usage 
-                SET input_tokens = ?, output_tokens = ?, total_tokens = ?
-                WHERE date = ?
-            """, (
-                existing_input + input_tokens,
-                existing_output + output_tokens,
-                existing_input + existing_output + total,
-                today
-            ))
-        else:
-            cursor.execute("""
-                INSERT INTO token_usage (date, input_tokens, output_tokens, total_tokens)
-                VALUES (?, ?, ?, ?)
-            """, (today, input_tokens, output_tokens, total))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"⚠️ Error adding tokens: {e}")
+# Uploads are streamed to disk in chunks and stored as pdf/<sha256>.pdf
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
-def get_token_usage(days=7):
-    """Get token usage for the last N days"""
-    try:
-        conn = sqlite3.connect(TOKEN_DB)
-        cursor = conn.cursor()
-        
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        cursor.execute("""
-            SELECT date, input_tokens, output_tokens, total_tokens
-            FROM token_usage
-            WHERE date >= ?
-            ORDER BY date DESC
-        """, (start_date,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        return [
-            {
-                "date": row[0],
-                "input_tokens": row[1],
-                "output_tokens": row[2],
-                "total_tokens": row[3]
-            }
-            for row in results
-        ]
-    except Exception as e:
-        print(f"⚠️ Error getting token usage: {e}")
-        return []
+# The document/audio catalog is a SQLite database shared by all worker processes, reconciled with
+# pdf/ and audio/ at startup; set this to also poll them for files added outside the API (0 disables polling)
+CATALOG_DB = "catalog.db"
+CATALOG_WATCH_SECONDS = float(os.getenv("CATALOG_WATCH_SECONDS", "0"))
 
-def get_today_tokens():
-    """Get today's token usage"""
-    try:
-        conn = sqlite3.connect(TOKEN_DB)
-        cursor = conn.cursor()
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        cursor.execute("""
-            SELECT input_tokens, output_tokens, total_tokens
-            FROM token_usage
-            WHERE date = ?
-        """, (today,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                "date": today,
-                "input_tokens": result[0],
-                "output_tokens": result[1],
-                "total_tokens": result[2]
-            }
-        else:
-            return {
-                "date": today,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0
-            }
-    except Exception as e:
-        print(f"⚠️ Error getting today's tokens: {e}")
-        return None
+# Storage quotas for pdf/ and audio/ (0 means no limit). A background task deletes the least
+# recently accessed files first; documents with work in flight are never deleted
+PDF_MAX_MB = int(os.getenv("PDF_MAX_MB", "10240"))
+PDF_MAX_FILES = int(os.getenv("PDF_MAX_FILES", "0"))
+PDF_MAX_AGE_DAYS = float(os.getenv("PDF_MAX_AGE_DAYS", "0"))
+AUDIO_MAX_MB = int(os.getenv("AUDIO_MAX_MB", "10240"))
+AUDIO_MAX_FILES = int(os.getenv("AUDIO_MAX_FILES", "0"))
+AUDIO_MAX_AGE_DAYS = float(os.getenv("AUDIO_MAX_AGE_DAYS", "0"))
+STORAGE_GC_SECONDS = float(os.getenv("STORAGE_GC_SECONDS", "300"))
+
+# Background audiobook jobs. Every server process runs JOB_WORKERS workers that claim jobs from jobs.db;
+# a job whose process stops sending heartbeats for JOB_LEASE_SECONDS is handed to another worker
+JOBS_DB = "jobs.db"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Per-document locks (flock on files here) keep worker processes from doing the same work twice
+LOCKS_DIR = os.getenv("LOCKS_DIR", "locks")
+# Documents of one batch processed at the same time (Gemini calls are still capped by GEMINI_MAX_IN_FLIGHT)
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", "4"))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "16"))
+
+# Text-to-speech: the summary is split into chunks that are synthesized in parallel
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "800"))
+TTS_RETRIES = int(os.getenv("TTS_RETRIES", "3"))
+# Engine used when a request doesn't pick one: "gtts", "espeak" (espeak-ng) or "piper".
+# The local engines run offline, one subprocess per chunk, and need ffmpeg to encode MP3
+TTS_ENGINE = os.getenv("TTS_ENGINE", "gtts")
+TTS_LOCAL_WORKERS = int(os.getenv("TTS_LOCAL_WORKERS", str(os.cpu_count() or 2)))
+ESPEAK_VOICE = os.getenv("ESPEAK_VOICE")
+PIPER_MODEL = os.getenv("PIPER_MODEL")
+LIVE_AUDIO_POLL_SECONDS = 0.2
+# Stream the summary from Gemini and synthesize each paragraph as soon as it is complete
+OVERLAP_TTS = os.getenv("OVERLAP_TTS", "true").lower() in ("1", "true", "yes")
+# Synthesized segments are kept by content so unchanged paragraphs are never synthesized twice (0 disables)
+SEGMENT_STORE_DIR = os.getenv("SEGMENT_STORE_DIR", "segments")
+SEGMENT_STORE_MAX_MB = int(os.getenv("SEGMENT_STORE_MAX_MB", "1024"))
+
+# Audio books are stored as MP3; other formats are transcoded by ffmpeg on first request and cached.
+# AUDIO_FORMAT ("mp3", "opus" or "aac") is served when a request names no format and its Accept header none we know
+AUDIO_FORMAT = os.getenv("AUDIO_FORMAT", "mp3")
+RENDITION_BITRATES = {
+    "mp3": os.getenv("MP3_BITRATE"),
+    "opus": os.getenv("OPUS_BITRATE", "24k"),
+    "aac": os.getenv("AAC_BITRATE", "48k"),
+}
+RENDITIONS_DIR = os.getenv("RENDITIONS_DIR", "renditions")
+RENDITIONS_MAX_MB = int(os.getenv("RENDITIONS_MAX_MB", "2048"))
+
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+
+# Summaries of long PDFs are built map-reduce style from locally extracted page ranges.
+# SUMMARY_MODE is "single", "map_reduce" or "auto" (map-reduce from MAP_REDUCE_MIN_PAGES pages)
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto")
+SUMMARY_MODES = ("single", "map_reduce", "auto")
+MAP_REDUCE_MIN_PAGES = int(os.getenv("MAP_REDUCE_MIN_PAGES", "40"))
+SUMMARY_CHUNK_PAGES = int(os.getenv("SUMMARY_CHUNK_PAGES", "20"))
+SUMMARY_FAN_OUT = int(os.getenv("SUMMARY_FAN_OUT", "4"))
+MIN_TEXT_CHARS_PER_PAGE = 100
+
+# PDFs go to Gemini as slimmed renditions: pages with at least MIN_TEXT_CHARS_PER_PAGE characters of text lose
+# their images, unused fonts and thumbnails are dropped and streams compressed. Made once per document, in SLIM_DIR
+SLIM_PDFS = os.getenv("SLIM_PDFS", "true").lower() in ("1", "true", "yes")
+SLIM_DIR = os.getenv("SLIM_DIR", "slim")
+SLIM_MAX_MB = int(os.getenv("SLIM_MAX_MB", "2048"))
+
+# Research-paper detection: local heuristics decide clear-cut documents, Gemini the rest.
+# CLASSIFIER_MODE is "auto" (heuristics first) or "llm" (always ask Gemini)
+CLASSIFIER_MODE = os.getenv("CLASSIFIER_MODE", "auto")
+CLASSIFIER_PAGES = 3
+CLASSIFIER_YES_SCORE = float(os.getenv("CLASSIFIER_YES_SCORE", "0.6"))
+CLASSIFIER_NO_SCORE = float(os.getenv("CLASSIFIER_NO_SCORE", "0.15"))
+
+# Heavy imports (google.genai, pypdf, gtts) and the Gemini client are loaded in the background
+# once the server has started, so it can answer /healthz at once. With WARM_UP=false they load on first use
+WARM_UP = os.getenv("WARM_UP", "true").lower() in ("1", "true", "yes")
+
+# Add a Server-Timing header with the per-stage breakdown to every response
+TIMING_HEADER = os.getenv("TIMING_HEADER", "true").lower() in ("1", "true", "yes")
+
+# Gemini access: calls share one pooled async client, capped at GEMINI_MAX_IN_FLIGHT at a time.
+# GEMINI_BASE_URL points the client at another server (e.g. a local fake in tests).
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL") or None
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "8"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+
+# Admission control: each Gemini call's tokens are estimated before it is sent, and the call is rejected when
+# it would exceed the daily budget or waits until it fits the per-minute rate (0 disables either limit).
+# Clients are told apart by the X-Client-Id header, or their address; background jobs wait longer than requests
+GEMINI_DAILY_TOKEN_BUDGET = int(os.getenv("GEMINI_DAILY_TOKEN_BUDGET", "1000000"))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "30"))
+ADMISSION_BATCH_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_BATCH_MAX_WAIT_SECONDS", "600"))
+# Ask Gemini's count_tokens for a PDF's input tokens (cached per document) instead of estimating from its pages
+GEMINI_COUNT_TOKENS = os.getenv("GEMINI_COUNT_TOKENS", "true").lower() in ("1", "true", "yes")
+PDF_TOKENS_PER_PAGE = 258
+CHARS_PER_TOKEN = 4
+# Output tokens set aside for each kind of call until its real usage is known
+ESTIMATED_OUTPUT_TOKENS = {
+    "analyze_pdf": 16,
+    "summarize_pdf": 2048,
+    "summarize_pdf_map": 1024,
+    "summarize_pdf_reduce": 2048,
+}
+
+ANALYZE_PROMPT = """
+PLEASE ANALYZE THE CONTENT OF THE PDF.
+Determine if this is a research paper or not.
+
+Look for these characteristics of research papers:
+- Abstract section
+- Introduction, methodology, results, conclusion sections
+- References/bibliography
+- Academic writing style
+- Citations and references to other papers
+
+Respond with ONLY:
+- "YES" if it is a research paper
+- "NO" if it is not a research paper
+"""
+
+RESEARCH_SUMMARY_PROMPT = """
+PLEASE SUMMARIZE THE CONTENT OF THIS RESEARCH PAPER PDF IN A WAY THAT WOULD SUIT AN AUDIOBOOK.
+The summary should be engaging, clear, and concise, highlighting the key points and findings.
+
+Guidelines for Research Papers:
+- Do not use AI terms like "this is a research paper" or "as an AI model"
+- Summarize like a human would for an audiobook
+- Be straightforward and conversational
+- Explain each point well with clear transitions
+- Explain scientific terms very clearly and simply
+- Use examples where necessary to illustrate complex concepts
+- Cover: background, methodology, key findings, conclusions, and implications
+- Structure it with clear sections and flow
+- Make it engaging for audio listening
+
+Format the summary with clear sections and smooth transitions between ideas.
+"""
+
+GENERAL_SUMMARY_PROMPT = """
+PLEASE SUMMARIZE THE CONTENT OF THIS PDF DOCUMENT IN A WAY THAT WOULD SUIT AN AUDIOBOOK.
+The summary should be engaging, clear, and concise, highlighting the main topics and key information.
+
+Guidelines for General Documents:
+- Do not use AI terms or mention that this is an AI summary
+- Summarize like a human would for an audiobook
+- Be straightforward and conversational
+- Explain each main point clearly with smooth transitions
+- Break down complex topics into simple, understandable language
+- Use examples where helpful to illustrate concepts
+- Structure it logically with clear flow between topics
+- Make it engaging and easy to follow for audio listening
+- Focus on the most important information and practical insights
+
+Format the summary with clear sections and smooth transitions between ideas.
+"""
+
+MAP_SUMMARY_PROMPT = """
+The text below was extracted from pages {first} to {last} of a longer document.
+Write detailed notes on this part: its main points, methods, findings and any terms that need explaining.
+These notes will later be combined with notes on the other parts, so do not add an introduction or conclusion.
+"""
+
+REDUCE_SUMMARY_PROMPT = """
+Below are notes on consecutive parts of one document, in order.
+Combine them into a single summary of the whole document following these instructions:
+"""
+
+def usage_counts(response):
+    """Input and output token counts from a Gemini response (0 when not reported)"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return 0, 0
+    input_tokens = getattr(usage, 'prompt_token_count', None) or getattr(usage, 'input_tokens', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', None) or getattr(usage, 'output_tokens', 0) or 0
+    return input_tokens, output_tokens
 
 def get_api_key():
     """Read API key from .GITIGNORE file or environment variable"""
@@ -155,18 +256,888 @@ def get_api_key():
         print(f"⚠️ Error reading API key: {e}")
         return None
 
+# A missing key doesn't stop the app from starting: /readyz reports it and Gemini calls fail with 503
 api_key = get_api_key()
 if not api_key:
-    raise ValueError("❌ API key not found in .GITIGNORE file")
+    print("⚠️ API key not found in .GITIGNORE file or GEMINI_API_KEY")
+
+# Token accounting: reads come from memory, writes are flushed to the database in batches
+token_ledger = TokenLedger(
+    TOKEN_DB,
+    flush_interval=TOKEN_FLUSH_SECONDS,
+    flush_threshold=TOKEN_FLUSH_THRESHOLD
+)
+
+result_cache = ResultCache(
+    RESULT_CACHE_DB,
+    max_memory_entries=RESULT_CACHE_MEMORY_ENTRIES,
+    max_disk_entries=RESULT_CACHE_DISK_ENTRIES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS
+)
+
+def make_gemini_client():
+    """Build the Gemini client. google.genai takes most of a second to import, so this runs
+    during warm-up in a worker thread (or on the first Gemini call), never at import time."""
+    if not api_key:
+        raise PipelineError("❌ Gemini API key is not configured on this server.", 503)
+    import httpx
+    from google import genai
+    from google.genai import types
+
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            base_url=GEMINI_BASE_URL,
+            async_client_args={
+                "limits": httpx.Limits(
+                    max_connections=GEMINI_MAX_IN_FLIGHT,
+                    max_keepalive_connections=GEMINI_MAX_IN_FLIGHT
+                )
+            }
+        )
+    )
+
+admission = AdmissionController(
+    GEMINI_DAILY_TOKEN_BUDGET,
+    GEMINI_TOKENS_PER_MINUTE,
+    used_today=lambda: token_ledger.today()["total_tokens"],
+    max_wait={INTERACTIVE: ADMISSION_MAX_WAIT_SECONDS, BATCH: ADMISSION_BATCH_MAX_WAIT_SECONDS}
+)
+
+gemini = GeminiGateway(
+    client_factory=make_gemini_client,
+    max_in_flight=GEMINI_MAX_IN_FLIGHT,
+    timeout=GEMINI_TIMEOUT_SECONDS,
+    max_retries=GEMINI_MAX_RETRIES
+)
+
+segment_store = (
+    SegmentStore(SEGMENT_STORE_DIR, max_bytes=SEGMENT_STORE_MAX_MB * 1024 * 1024) if SEGMENT_STORE_MAX_MB > 0 else None
+)
+
+if AUDIO_FORMAT not in FORMATS:
+    print(f"⚠️ Unknown AUDIO_FORMAT {AUDIO_FORMAT}, serving mp3")
+    AUDIO_FORMAT = "mp3"
+document_locks = DocumentLocks(LOCKS_DIR)
+renditions = RenditionCache(RENDITIONS_DIR, max_bytes=RENDITIONS_MAX_MB * 1024 * 1024, locks=document_locks)
+slim_pdfs = SlimCache(
+    SLIM_DIR, max_bytes=SLIM_MAX_MB * 1024 * 1024, locks=document_locks, min_text_chars=MIN_TEXT_CHARS_PER_PAGE
+)
+
+tts_engines = {
+    "gtts": GTTSEngine(workers=TTS_WORKERS),
+    "espeak": espeak_engine(workers=TTS_LOCAL_WORKERS, voice=ESPEAK_VOICE),
+}
+if PIPER_MODEL:
+    tts_engines["piper"] = piper_engine(PIPER_MODEL, workers=TTS_LOCAL_WORKERS)
+if TTS_ENGINE not in tts_engines or not tts_engines[TTS_ENGINE].available():
+    print(f"⚠️ TTS engine {TTS_ENGINE} is not available, falling back to gtts")
+    TTS_ENGINE = "gtts"
+
+class PipelineError(Exception):
+    """A pipeline stage failed with a message that should be returned to the client"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def select_tts_engine(name=None):
+    """The TTS engine called ``name``, or the configured default"""
+    engine = tts_engines.get(name or TTS_ENGINE)
+    if engine is None:
+        raise PipelineError(f"❌ Unknown TTS engine {name}. Choose one of: {', '.join(tts_engines)}.")
+    if not engine.available():
+        raise PipelineError(f"❌ TTS engine {name} is not installed on this server.")
+    return engine
+
+def resolve_document(document_id=None):
+    """Look up a document by id, or the latest upload when no id is given"""
+    doc = catalog.get(document_id) if document_id else catalog.latest_document()
+    if doc:
+        catalog.touch(doc_id=doc["id"])
+    return doc
+
+# Documents being processed by this process right now, with how many pipelines use each
+active_documents = Counter()
+
+@asynccontextmanager
+async def document_pin(doc_id):
+    """Keep a document from being evicted while the block runs.
+
+    Besides the local count, the pin holds a shared lock on the document so
+    storage GC in other worker processes sees it as in use too.
+    """
+    async with document_locks.hold(doc_id, "pin", shared=True):
+        active_documents[doc_id] += 1
+        try:
+            yield
+        finally:
+            active_documents[doc_id] -= 1
+            if active_documents[doc_id] <= 0:
+                del active_documents[doc_id]
+
+def pins_document(func):
+    """Keep the document passed as first argument from being evicted while func runs"""
+    @functools.wraps(func)
+    async def wrapper(doc, *args, **kwargs):
+        async with document_pin(doc["id"]):
+            return await func(doc, *args, **kwargs)
+    return wrapper
+
+def pinned_documents():
+    """Documents that storage GC must keep: in use now, or named by a queued or running job"""
+    pinned = set(active_documents)
+    for job in job_store.unfinished():
+        params = job["params"]
+        if params.get("document_id"):
+            pinned.add(params["document_id"])
+        pinned.update(item["document_id"] for item in params.get("documents", []) if item.get("document_id"))
+    return pinned
+
+def invalid_mode_response(mode):
+    """400 response for an unknown summarization mode, or None when it is fine"""
+    if mode is not None and mode not in SUMMARY_MODES:
+        return JSONResponse(
+            status_code=400,
+            content={"message": "❌ Invalid mode. Use 'single', 'map_reduce' or 'auto'."}
+        )
+    return None
+
+def missing_document_response(document_id, message):
+    """404 response for a document id that isn't in the catalog, or for an empty pdf/ folder"""
+    if document_id:
+        message = f"❌ Document {document_id} not found."
+    return JSONResponse(status_code=404, content={"message": message})
+
+async def read_document(doc):
+    """Read a document's bytes off the event loop"""
+    with metrics.stage("read_pdf"):
+        pdf_bytes = await run_in_threadpool(pathlib.Path(doc["path"]).read_bytes)
+    metrics.inc("bytes_total", len(pdf_bytes), stage="read_pdf", direction="in")
+    return pdf_bytes
+
+def cached_result(kind, cache_key):
+    """Look up a cached Gemini result, counting hits and misses per kind"""
+    cached = result_cache.get(cache_key)
+    metrics.inc("result_cache_lookups_total", kind=kind, result="hit" if cached else "miss")
+    return cached
+
+async def coalesced(stage, key, func, listener=None):
+    """Run ``func(emit)`` once for all concurrent requests with the same stage and key (see SingleFlight)"""
+    role = "follower" if flights.in_flight((stage, key)) else "leader"
+    metrics.inc("single_flight_total", stage=stage, role=role)
+    return await flights.run((stage, key), func, listener)
+
+async def read_model_input(doc, pdf_hash, pdf_bytes=None):
+    """The PDF bytes to send to Gemini: the document's slimmed rendition, or the original with SLIM_PDFS off"""
+    if not SLIM_PDFS:
+        return pdf_bytes if pdf_bytes is not None else await read_document(doc)
+    with metrics.stage("slim_pdf"):
+        model_bytes = await run_in_threadpool(slim_pdfs.read, doc["path"], pdf_hash)
+    if model_bytes is None:
+        return pdf_bytes if pdf_bytes is not None else await read_document(doc)
+    metrics.inc("bytes_total", len(model_bytes), stage="slim_pdf", direction="out")
+    return model_bytes
+
+async def document_hash(doc):
+    """SHA-256 of a document, plus its bytes if they had to be read to compute it"""
+    if doc["sha256"]:
+        return doc["sha256"], None
+    pdf_bytes = await read_document(doc)
+    pdf_hash = content_hash(pdf_bytes)
+    catalog.set_hash(doc["id"], pdf_hash)
+    return pdf_hash, pdf_bytes
+
+async def document_pages(doc):
+    """Page count of a document, cached per document hash so repeat requests don't parse the PDF"""
+    pdf_hash, _ = await document_hash(doc)
+    cache_key = make_cache_key("page_count", pdf_hash, "local", "v1")
+    cached = result_cache.get(cache_key)
+    if cached:
+        return cached["pages"]
+    with metrics.stage("page_count"):
+        pages = await run_in_threadpool(page_count, doc["path"])
+    result_cache.set(cache_key, {"pages": pages})
+    return pages
+
+def estimate_text_tokens(*texts):
+    """Rough token count of some text, from its length"""
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN
+
+async def estimate_pdf_tokens(doc, pdf_hash, model_bytes=None):
+    """Input tokens of a PDF sent to Gemini (``model_bytes`` is what read_model_input returns, if already read).
+
+    Gemini's count_tokens answer is cached per document hash; without it (or
+    when GEMINI_COUNT_TOKENS is off) the estimate is PDF_TOKENS_PER_PAGE per page.
+    """
+    cache_key = make_cache_key("token_count", pdf_hash, GEMINI_MODEL, "slim" if SLIM_PDFS else "original")
+    cached = result_cache.get(cache_key)
+    if cached:
+        return cached["tokens"]
+
+    if GEMINI_COUNT_TOKENS:
+        try:
+            if model_bytes is None:
+                model_bytes = await read_model_input(doc, pdf_hash)
+            from google.genai import types
+            with metrics.stage("count_tokens"):
+                tokens = await gemini.count_tokens(
+                    model=GEMINI_MODEL,
+                    contents=[types.Part.from_bytes(data=model_bytes, mime_type='application/pdf')]
+                )
+            result_cache.set(cache_key, {"tokens": tokens})
+            return tokens
+        except PipelineError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Could not count tokens of {doc['filename']}, estimating from its pages: {e}")
+
+    try:
+        pages = await document_pages(doc)
+    except Exception:
+        # Unreadable here; assume a typical 100 KB per page
+        pages = max(1, doc["size_bytes"] // (100 * 1024))
+    return pages * PDF_TOKENS_PER_PAGE
+
+def budget_rejection(e):
+    """PipelineError (429) for a Gemini call the admission controller turned down"""
+    metrics.inc("admission_rejections_total", reason=e.reason)
+    return PipelineError(e.message, 429)
+
+async def ask_gemini(contents, endpoint, on_text=None, input_tokens=None):
+    """Send contents to Gemini, record the tokens used and return the response text.
+
+    With ``on_text`` the answer is streamed and each piece of text is passed to
+    ``on_text(text)`` as it arrives. The call first goes through admission
+    control with ``input_tokens`` (estimated from the text parts if not given)
+    plus the output expected for ``endpoint``; a call that doesn't fit today's
+    budget, or waits too long for the per-minute rate, raises a 429 PipelineError.
+    """
+    if input_tokens is None:
+        input_tokens = estimate_text_tokens(*(part for part in contents if isinstance(part, str)))
+    queued_at = time.perf_counter()
+    try:
+        async with admission.admit(input_tokens + ESTIMATED_OUTPUT_TOKENS.get(endpoint, 1024)) as ticket:
+            metrics.record_stage("admission", time.perf_counter() - queued_at)
+            with metrics.stage("gemini", endpoint=endpoint):
+                if on_text is None:
+                    response = await gemini.generate_content(model=GEMINI_MODEL, contents=contents)
+                    text = response.text
+                else:
+                    pieces, response = [], None
+                    async for response in gemini.generate_content_stream(model=GEMINI_MODEL, contents=contents):
+                        if response.text:
+                            pieces.append(response.text)
+                            on_text(response.text)
+                    text = "".join(pieces)
+
+            # Track token usage
+            used_input, used_output = usage_counts(response)
+            token_ledger.record(used_input, used_output, model=GEMINI_MODEL, endpoint=endpoint)
+            ticket.settle(used_input + used_output)
+    except AdmissionRejected as e:
+        raise budget_rejection(e)
+    metrics.inc("gemini_tokens_total", used_input, endpoint=endpoint, direction="input")
+    metrics.inc("gemini_tokens_total", used_output, endpoint=endpoint, direction="output")
+
+    return text.strip()
+
+async def cached_text(kind, cache_key, compute, on_text=None):
+    """Text cached under cache_key, or else ``await compute(emit)``, stored there; returns ``(text, cache_hit)``.
+
+    ``on_text`` streams the text as in ask_gemini (a cached text arrives in one
+    piece). Concurrent requests in this process share one run of compute, a
+    late one getting the text streamed so far and then the rest; worker
+    processes take turns under the key's lock and find the text in the cache.
+    When compute returns None nothing is cached and None is returned.
+    """
+    cached = cached_result(kind, cache_key)
+    if cached:
+        if on_text:
+            on_text(cached["text"])
+        return cached["text"], True
+
+    async def produce(emit):
+        async with document_locks.hold(cache_key, "result"):
+            cached = result_cache.get(cache_key)
+            if cached:
+                if emit:
+                    emit(cached["text"])
+                return cached["text"], True
+
+            text = await compute(emit)
+            if text is None:
+                return None
+            result_cache.set(cache_key, {"text": text})
+        return text, False
+
+    return await coalesced(
+        kind, (cache_key, on_text is not None), lambda emit: produce(emit if on_text else None), on_text
+    )
+
+async def generate_cached(kind, doc, prompt, endpoint, on_text=None):
+    """Run a Gemini prompt over a document, reusing a cached answer when there is one.
+
+    Returns the response text and whether it came from the cache; ``on_text``
+    streams the answer (see cached_text).
+    """
+    pdf_hash, pdf_bytes = await document_hash(doc)
+    cache_key = make_cache_key(kind, pdf_hash, GEMINI_MODEL, prompt_version(prompt))
+
+    async def ask(emit):
+        document_bytes = await read_model_input(doc, pdf_hash, pdf_bytes)
+        input_tokens = await estimate_pdf_tokens(doc, pdf_hash, document_bytes) + estimate_text_tokens(prompt)
+
+        # Building the client imports the SDK in a worker thread, so the import below is free
+        await gemini.warm_up()
+        from google.genai import types
+
+        return await ask_gemini(
+            [
+                types.Part.from_bytes(
+                    data=document_bytes,
+                    mime_type='application/pdf',
+                ),
+                prompt
+            ],
+            endpoint,
+            emit,
+            input_tokens
+        )
+
+    return await cached_text(kind, cache_key, ask, on_text)
+
+def map_reduce_version(prompt):
+    """Cache version of a map-reduce summary: changes with any of its prompts or the chunk size"""
+    return prompt_version(f"{prompt}{MAP_SUMMARY_PROMPT}{REDUCE_SUMMARY_PROMPT}{SUMMARY_CHUNK_PAGES}")
+
+async def summarize_map_reduce(doc, prompt, on_text=None):
+    """Summarize a long document from locally extracted text, one page range at a time.
+
+    Page ranges of SUMMARY_CHUNK_PAGES pages are summarized concurrently (at most
+    SUMMARY_FAN_OUT at once) and the partial summaries are merged into one
+    audiobook narrative, which is streamed to ``on_text`` if given. Returns
+    ``(summary, cache_hit)``, or None when the PDF has too little extractable
+    text (e.g. a scan) for this to work.
+    """
+    pdf_hash, _ = await document_hash(doc)
+    cache_key = make_cache_key("summary_map_reduce", pdf_hash, GEMINI_MODEL, map_reduce_version(prompt))
+    return await cached_text(
+        "summary_map_reduce", cache_key, lambda emit: map_reduce_summary(doc, prompt, emit), on_text
+    )
+
+async def map_reduce_summary(doc, prompt, on_text=None):
+    """Map and reduce steps of summarize_map_reduce; returns the summary, or None if there is too little text.
+
+    Page ranges are extracted one after another in a worker thread, and each
+    range's map call starts as soon as its text is ready, so Gemini works while
+    the rest of the document is still being extracted. Whether there is enough
+    text, and how many tokens the run needs, is judged from the first range.
+    """
+    ranges = iter_page_ranges(doc["path"], SUMMARY_CHUNK_PAGES)
+
+    async def next_range():
+        with metrics.stage("extract_text"):
+            return await run_in_threadpool(next, ranges, None)
+
+    try:
+        chunk = await next_range()
+        page_total = await document_pages(doc)
+    except Exception as e:
+        print(f"⚠️ Could not extract text from {doc['filename']}: {e}")
+        return None
+    if chunk is None or len(chunk[2]) < MIN_TEXT_CHARS_PER_PAGE * (chunk[1] - chunk[0] + 1):
+        return None
+
+    # Check the whole run against today's budget before the first call, rather than running out halfway
+    range_count = -(-page_total // SUMMARY_CHUNK_PAGES)
+    map_tokens = range_count * (
+        estimate_text_tokens(MAP_SUMMARY_PROMPT, chunk[2]) + ESTIMATED_OUTPUT_TOKENS["summarize_pdf_map"]
+    )
+    try:
+        admission.check_budget(map_tokens + ESTIMATED_OUTPUT_TOKENS["summarize_pdf_reduce"])
+    except AdmissionRejected as e:
+        raise budget_rejection(e)
+
+    fan_out = asyncio.Semaphore(SUMMARY_FAN_OUT)
+
+    async def summarize_chunk(first, last, text):
+        async with fan_out:
+            return await ask_gemini(
+                [MAP_SUMMARY_PROMPT.format(first=first, last=last), text],
+                "summarize_pdf_map"
+            )
+
+    maps = []
+    try:
+        while chunk is not None:
+            first, last, text = chunk
+            if text:
+                maps.append((first, last, asyncio.ensure_future(summarize_chunk(first, last, text))))
+            try:
+                chunk = await next_range()
+            except Exception as e:
+                print(f"⚠️ Could not extract text from {doc['filename']}: {e}")
+                return None
+        partials = await asyncio.gather(*(task for _, _, task in maps))
+    finally:
+        for _, _, task in maps:
+            if not task.done():
+                task.cancel()
+
+    notes = "\n\n".join(
+        f"Pages {first}-{last}:\n{partial}" for (first, last, _), partial in zip(maps, partials)
+    )
+    return await ask_gemini([REDUCE_SUMMARY_PROMPT + prompt, notes], "summarize_pdf_reduce", on_text)
+
+def extract_classifier_text(path):
+    """Text of the first and last CLASSIFIER_PAGES pages of a PDF (the last is empty when they would overlap)"""
+    first, last = extract_ends(path, CLASSIFIER_PAGES)
+    return "\n".join(first), "\n".join(last)
+
+async def classify_locally(doc):
+    """Score a document with the local heuristics; returns (is_research_paper or None, score, signals, cache_hit).
+
+    The score depends only on the document's text, so it is cached per
+    document hash and the PDF is parsed once, not on every request.
+    """
+    pdf_hash, _ = await document_hash(doc)
+    cache_key = make_cache_key("analysis_heuristic", pdf_hash, "local", f"v{CLASSIFIER_VERSION}-{CLASSIFIER_PAGES}")
+    cached = result_cache.get(cache_key)
+    if cached:
+        score, signals = cached["score"], cached["signals"]
+    else:
+        try:
+            with metrics.stage("classify_heuristic"):
+                first_pages, last_pages = await run_in_threadpool(extract_classifier_text, doc["path"])
+        except Exception as e:
+            print(f"⚠️ Could not extract text from {doc['filename']} for classification: {e}")
+            return None, None, {}, False
+        score, signals = score_research_paper(first_pages, last_pages)
+        result_cache.set(cache_key, {"score": score, "signals": signals})
+    return decide(score, CLASSIFIER_YES_SCORE, CLASSIFIER_NO_SCORE), score, signals, bool(cached)
+
+@pins_document
+async def classify_document(doc):
+    """Decide whether a document is a research paper.
+
+    Clear-cut documents are decided by the local heuristics; Gemini is only asked
+    when the heuristic score is ambiguous (or CLASSIFIER_MODE is "llm").
+    Concurrent requests for the same document share one classification.
+    """
+    return await coalesced("classify", doc["id"], lambda emit: run_classification(doc))
+
+async def run_classification(doc):
+    """Heuristic and Gemini steps of classify_document"""
+    decision, score, signals, heuristic_hit = None, None, {}, False
+    with metrics.stage("classify"):
+        if CLASSIFIER_MODE != "llm":
+            decision, score, signals, heuristic_hit = await classify_locally(doc)
+
+        if decision is not None:
+            ai_text, cache_hit, decided_by = ("YES" if decision else "NO"), heuristic_hit, "heuristic"
+        else:
+            ai_text, cache_hit = await generate_cached("analysis", doc, ANALYZE_PROMPT, "analyze_pdf")
+            decided_by = "llm"
+    metrics.inc("classifications_total", decided_by=decided_by)
+
+    is_research_paper = "YES" in ai_text.upper()
+    catalog.set_analysis(doc["id"], RESEARCH_PAPER if is_research_paper else NOT_RESEARCH_PAPER)
+    return {
+        "is_research_paper": is_research_paper,
+        "ai_response": ai_text,
+        "decided_by": decided_by,
+        "heuristic_score": score,
+        "heuristic_signals": signals,
+        "cache_hit": cache_hit
+    }
+
+@pins_document
+async def summarize_document(doc, mode=None, on_text=None):
+    """Summarize a research paper for audio; other documents are rejected to save tokens.
+
+    ``mode`` is "single" (send the whole PDF in one call), "map_reduce" (see
+    summarize_map_reduce) or "auto", which uses map-reduce for documents of
+    MAP_REDUCE_MIN_PAGES pages or more. Defaults to SUMMARY_MODE. ``on_text``
+    receives the summary piece by piece while Gemini is still writing it.
+    """
+    analysis = await classify_document(doc)
+    is_research_paper = analysis["is_research_paper"]
+    if not is_research_paper:
+        raise PipelineError("❌ PDF is not a valid research paper. Summarization skipped to save tokens.")
+
+    prompt = RESEARCH_SUMMARY_PROMPT if is_research_paper else GENERAL_SUMMARY_PROMPT
+
+    mode = mode or SUMMARY_MODE
+    if mode == "auto":
+        try:
+            pages = await document_pages(doc)
+        except Exception as e:
+            print(f"⚠️ Could not count pages of {doc['filename']}, summarizing in one call: {e}")
+            pages = 0
+        mode = "map_reduce" if pages >= MAP_REDUCE_MIN_PAGES else "single"
+
+    with metrics.stage("summarize"):
+        result = await summarize_map_reduce(doc, prompt, on_text) if mode == "map_reduce" else None
+        if result is None:
+            mode = "single"
+            result = await generate_cached("summary", doc, prompt, "summarize_pdf", on_text)
+    summary, cache_hit = result
+    metrics.inc("summaries_total", mode=mode)
+
+    return {
+        "is_research_paper": is_research_paper,
+        "summary": summary,
+        "summary_mode": mode,
+        "cache_hit": cache_hit
+    }
+
+def synthesize_audio(text, doc, engine):
+    """Convert summary text to speech with ``engine``; returns the MP3's path in audio/ and synthesis stats"""
+    os.makedirs("audio", exist_ok=True)
+
+    language = 'en'
+    audio_filename = audio_filename_for(doc["id"])
+    audio_path = os.path.join("audio", audio_filename)
+
+    # Expose the book to streaming listeners, in any worker process, while its chunks are being synthesized
+    live = LiveAudio("audio", audio_filename)
+    try:
+        with metrics.stage("tts", engine=engine.name):
+            synthesis = synthesize_to_file(
+                text,
+                audio_path,
+                lang=language,
+                workers=engine.workers,
+                chunk_chars=TTS_CHUNK_CHARS,
+                retries=TTS_RETRIES,
+                on_chunk=live.append,
+                engine=engine,
+                store=segment_store
+            )
+        live.finish()
+    except BaseException as e:
+        live.finish(error=e)
+        raise
+
+    metrics.record_stage("write_audio", synthesis["write_seconds"])
+    metrics.inc("tts_chunks_total", synthesis["chunks"] - synthesis["reused"], engine=engine.name, source="synthesized")
+    metrics.inc("tts_chunks_total", synthesis["reused"], engine=engine.name, source="segment_store")
+    metrics.inc("bytes_total", synthesis["bytes"], stage="tts", direction="out")
+
+    catalog.add_audio(audio_path, doc_id=doc["id"], sha256=synthesis["sha256"])
+    return audio_path, synthesis
+
+def iterate_paragraphs(paragraphs):
+    """Yield paragraphs from a queue until None; an exception in the queue is raised"""
+    while True:
+        item = paragraphs.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+@pins_document
+async def summarize_with_audio(doc, tts_engine, mode=None, on_text=None):
+    """Summarize a document and synthesize the summary at the same time.
+
+    The summary is streamed from Gemini and every paragraph goes to the TTS
+    threads as soon as it is complete, so speech synthesis runs while the model
+    is still writing. Returns the summary data, the MP3 path and synthesis stats.
+    Concurrent requests for the same document, engine and mode share one run.
+    """
+    return await coalesced(
+        "summary_audio", (doc["id"], tts_engine.name, mode),
+        lambda emit: overlap_summary_and_speech(doc, tts_engine, mode, emit), on_text
+    )
+
+async def overlap_summary_and_speech(doc, tts_engine, mode, on_text):
+    """Summarization and speech synthesis steps of summarize_with_audio"""
+    paragraphs = queue.Queue()
+    buffer = ParagraphBuffer()
+    tts_task = None
+
+    def send(completed):
+        nonlocal tts_task
+        for paragraph in completed:
+            paragraphs.put(paragraph)
+        if completed and tts_task is None:
+            tts_task = asyncio.ensure_future(
+                run_in_threadpool(synthesize_audio, iterate_paragraphs(paragraphs), doc, tts_engine)
+            )
+
+    def on_summary_text(text):
+        if on_text:
+            on_text(text)
+        send(buffer.feed(text))
+
+    try:
+        summary_data = await summarize_document(doc, mode, on_text=on_summary_text)
+        send(buffer.flush())
+    except BaseException as e:
+        # Stop the TTS threads waiting for more paragraphs
+        paragraphs.put(e if isinstance(e, Exception) else PipelineError("❌ Summarization was cancelled."))
+        if tts_task:
+            tts_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        raise
+    paragraphs.put(None)
+
+    if tts_task is None:
+        raise PipelineError("❌ Gemini returned an empty summary.", 502)
+    audio_path, synthesis = await tts_task
+    return summary_data, audio_path, synthesis
+
+@pins_document
+async def run_audiobook_pipeline(doc, progress=None, engine=None):
+    """Summarize a document and convert the summary to an MP3.
+
+    Speech synthesis blocks, so it runs in the threadpool. ``engine`` names the
+    TTS engine (the configured default if None). ``progress``, if given, is
+    called as ``progress(stage, fraction)`` when each stage starts. Concurrent
+    requests for the same document and engine share one run, and each of them
+    sees its progress.
+    """
+    tts_engine = select_tts_engine(engine)
+    return await coalesced(
+        "audiobook", (doc["id"], tts_engine.name),
+        lambda emit: generate_audiobook(doc, tts_engine, emit), progress
+    )
+
+async def preflight_budget(doc):
+    """Reject a book up front when the Gemini calls it still needs don't fit in today's token budget.
+
+    Without this a job could spend tokens on classification and then be
+    turned down for the summary.
+    """
+    if admission.remaining_today() is None:
+        return
+    # The job may have been queued before the document was classified
+    status = (catalog.get(doc["id"]) or doc)["analysis_status"]
+    if status == NOT_RESEARCH_PAPER:
+        # The book is refused before any Gemini call, for free
+        return
+    needs_analysis = status != RESEARCH_PAPER
+    if needs_analysis and CLASSIFIER_MODE != "llm":
+        decision, _, _, _ = await classify_locally(doc)
+        if decision is False:
+            return
+        needs_analysis = decision is None
+
+    pdf_hash, _ = await document_hash(doc)
+    # Only research papers are summarized, so these are the summaries a book can reuse
+    summary_keys = (
+        make_cache_key("summary", pdf_hash, GEMINI_MODEL, prompt_version(RESEARCH_SUMMARY_PROMPT)),
+        make_cache_key("summary_map_reduce", pdf_hash, GEMINI_MODEL, map_reduce_version(RESEARCH_SUMMARY_PROMPT)),
+    )
+    if any(result_cache.get(key) for key in summary_keys):
+        return
+
+    pdf_tokens = await estimate_pdf_tokens(doc, pdf_hash)
+    needed = pdf_tokens + estimate_text_tokens(RESEARCH_SUMMARY_PROMPT) + ESTIMATED_OUTPUT_TOKENS["summarize_pdf"]
+    if needs_analysis:
+        needed += pdf_tokens + estimate_text_tokens(ANALYZE_PROMPT) + ESTIMATED_OUTPUT_TOKENS["analyze_pdf"]
+    try:
+        admission.check_budget(needed)
+    except AdmissionRejected as e:
+        raise budget_rejection(e)
+
+async def generate_audiobook(doc, tts_engine, progress):
+    """Summarization and speech synthesis steps of run_audiobook_pipeline"""
+    await preflight_budget(doc)
+    # Books are generated one at a time per document across worker processes; a duplicate request
+    # waits and then runs on the summary and speech segments the first one cached
+    async with document_locks.hold(doc["id"], "audiobook"):
+        if OVERLAP_TTS:
+            progress("summarizing_and_synthesizing", 0.1)
+            summary_data, audio_path, synthesis = await summarize_with_audio(doc, tts_engine)
+            text = summary_data["summary"]
+        else:
+            progress("summarizing", 0.1)
+            summary_data = await summarize_document(doc)
+            text = summary_data["summary"]
+
+            progress("synthesizing", 0.6)
+            audio_path, synthesis = await run_in_threadpool(synthesize_audio, text, doc, tts_engine)
+    audio_filename = os.path.basename(audio_path)
+
+    return {
+        "source_pdf": doc["filename"],
+        "document_id": doc["id"],
+        "audio_file": audio_filename,
+        "audio_path": audio_path,
+        "text_length": len(text),
+        "word_count": len(text.split()),
+        "tts_engine": tts_engine.name,
+        "segments": synthesis["chunks"],
+        "segments_reused": synthesis["reused"],
+        "download_url": f"/download_audio_book/?audio_file={audio_filename}"
+    }
+
+async def run_audiobook_job(params, progress):
+    """Job handler for queued audiobook generation"""
+    document_id = params.get("document_id")
+    if not document_id and params.get("pdf_path"):
+        document_id = os.path.basename(params["pdf_path"])[:-len(".pdf")]
+    doc = catalog.get(document_id)
+    if not doc or not os.path.exists(doc["path"]):
+        raise PipelineError(f"❌ Document {document_id} no longer exists.", 404)
+    with identity(params.get("client"), BATCH):
+        return await run_audiobook_pipeline(doc, progress, engine=params.get("tts_engine"))
+
+async def run_batch_job(params, progress):
+    """Job handler for batches: run the audiobook pipeline for each document, a few at a time.
+
+    Each document's status, stage and result are written to the job as soon as
+    they change, so the batch can be polled while it runs.
+    """
+    items = params["documents"]
+    semaphore = asyncio.Semaphore(max(1, params.get("parallelism") or BATCH_PARALLELISM))
+    finished = sum(1 for item in items if item["status"] in (COMPLETED, FAILED))
+
+    def report():
+        fraction = finished / len(items) if items else 1.0
+        progress(f"{finished}/{len(items)} documents", fraction, result={"documents": items})
+
+    async def process(item):
+        nonlocal finished
+        async with semaphore:
+            item["status"] = RUNNING
+
+            def on_stage(stage, fraction):
+                item["stage"] = stage
+                report()
+
+            try:
+                doc = catalog.get(item["document_id"])
+                if not doc or not os.path.exists(doc["path"]):
+                    raise PipelineError(f"❌ Document {item['document_id']} no longer exists.", 404)
+                item["result"] = await run_audiobook_pipeline(doc, on_stage, engine=params.get("tts_engine"))
+                item["status"] = COMPLETED
+            except PipelineError as e:
+                item["status"], item["error"] = FAILED, e.message
+            except Exception as e:
+                print(f"⚠️ Batch document {item['document_id']} failed: {e}")
+                item["status"], item["error"] = FAILED, str(e)
+            item["stage"] = item["status"]
+            finished += 1
+            report()
+
+    report()
+    with identity(params.get("client"), BATCH):
+        await asyncio.gather(*(process(item) for item in items if item["status"] == QUEUED))
+    return {
+        "documents": items,
+        "completed": sum(1 for item in items if item["status"] == COMPLETED),
+        "failed": sum(1 for item in items if item["status"] == FAILED)
+    }
+
+catalog = Catalog("pdf", "audio", CATALOG_DB)
+flights = SingleFlight()
+metrics = Metrics()
+metrics.describe("stage_duration_seconds", "Time spent in each pipeline stage")
+metrics.describe("http_request_duration_seconds", "HTTP request latency by route")
+metrics.describe("bytes_total", "Bytes read or written by each stage")
+metrics.describe("gemini_tokens_total", "Gemini tokens used by endpoint")
+metrics.describe("result_cache_lookups_total", "Result cache lookups by kind and outcome")
+metrics.describe("classifications_total", "Documents classified, by what decided")
+metrics.describe("summaries_total", "Summaries served, by summarization mode")
+metrics.describe("tts_chunks_total", "Text chunks turned into speech, synthesized or reused from the segment store")
+metrics.describe("admission_rejections_total", "Gemini calls turned down by admission control, by reason")
+metrics.describe("single_flight_total", "Pipeline stage runs started (leader) or joined while in flight (follower)")
+metrics.gauge("gemini_in_flight", lambda: gemini.in_flight, "Gemini calls currently in flight")
+metrics.gauge("admission_waiting", lambda: admission.stats()["waiting"], "Gemini calls waiting for the per-minute token rate")
+metrics.gauge("gemini_tokens_last_minute", lambda: admission.stats()["tokens_last_minute"], "Gemini tokens admitted over the last minute")
+metrics.gauge("single_flight_in_flight", lambda: flights.in_flight(), "Pipeline stage runs that requests can join")
+metrics.gauge("live_syntheses", lambda: len(live_audio_files("audio")), "Audio books currently being synthesized")
+metrics.gauge("jobs_pending", lambda: job_queue.pending(), "Background jobs waiting for a worker")
+metrics.gauge("pdf_storage_bytes", lambda: storage.usage()["pdf"]["bytes"], "Bytes stored in pdf/")
+metrics.gauge("audio_storage_bytes", lambda: storage.usage()["audio"]["bytes"], "Bytes stored in audio/")
+
+job_store = JobStore(JOBS_DB)
+storage = StorageManager(
+    catalog,
+    pdf_quota=Quota(PDF_MAX_MB * 1024 * 1024, PDF_MAX_FILES, PDF_MAX_AGE_DAYS * 24 * 3600),
+    audio_quota=Quota(AUDIO_MAX_MB * 1024 * 1024, AUDIO_MAX_FILES, AUDIO_MAX_AGE_DAYS * 24 * 3600),
+    pinned=pinned_documents,
+    hold_if_free=lambda doc_id: document_locks.hold_if_free(doc_id, "pin")
+)
+job_queue = JobQueue(
+    job_store,
+    {"audiobook": run_audiobook_job, "batch": run_batch_job},
+    workers=JOB_WORKERS,
+    poll_interval=JOB_POLL_SECONDS,
+    lease_seconds=JOB_LEASE_SECONDS
+)
 
-# Initialize token tracking database
-init_token_db()
+STARTED_AT = time.monotonic()
+warm_up_state = {"status": "pending", "seconds": None, "error": None}
+
+def import_heavy_modules():
+    """Import the libraries kept out of startup so the first requests don't wait for them"""
+    import pypdf  # noqa: F401
+    from google.genai import types  # noqa: F401
+    if TTS_ENGINE == "gtts":
+        import gtts  # noqa: F401
+
+async def warm_up():
+    """Load heavy modules and build the Gemini client off the event loop"""
+    started = time.perf_counter()
+    warm_up_state["status"] = "running"
+    try:
+        await run_in_threadpool(import_heavy_modules)
+        if api_key:
+            await gemini.warm_up()
+        warm_up_state["status"] = "done"
+    except Exception as e:
+        print(f"⚠️ Warm-up failed: {e}")
+        warm_up_state["status"] = "failed"
+        warm_up_state["error"] = str(e)
+    finally:
+        warm_up_state["seconds"] = round(time.perf_counter() - started, 3)
+        metrics.record_stage("warm_up", time.perf_counter() - started)
+
+def dependency_checks():
+    """State of each dependency; the app is ready when every required one is ok"""
+    engine = tts_engines[TTS_ENGINE]
+    return {
+        "gemini": {
+            "ok": bool(api_key) and gemini.client_error is None,
+            "required": True,
+            "api_key_configured": bool(api_key),
+            "client_ready": gemini.client_ready,
+            "error": gemini.client_error,
+        },
+        "warm_up": {"ok": warm_up_state["status"] != "failed", "required": True, **warm_up_state},
+        "catalog": {"ok": catalog.loaded_at is not None, "required": True, "documents": catalog.document_count()},
+        "token_ledger": {"ok": token_ledger.running(), "required": True},
+        "job_queue": {"ok": job_queue.running(), "required": True, "pending": job_queue.pending()},
+        "tts": {"ok": engine.available(), "required": True, "engine": TTS_ENGINE},
+        "ffmpeg": {"ok": renditions.available(), "required": False},
+    }
+
+@asynccontextmanager
+async def lifespan(app):
+    catalog.load()
+    catalog.start_watching(CATALOG_WATCH_SECONDS)
+    token_ledger.start()
+    await job_queue.start()
+    storage.start(STORAGE_GC_SECONDS)
+    warm_up_task = asyncio.create_task(warm_up()) if WARM_UP else None
+    yield
+    if warm_up_task:
+        warm_up_task.cancel()
+    storage.stop()
+    await job_queue.stop()
+    token_ledger.stop()
+    catalog.stop_watching()
 
-client = genai.Client(api_key=api_key)
 app = FastAPI(
     title="PDF to Audio Converter API",
     description="Convert PDF documents to audiobooks using AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for React frontend
@@ -178,6 +1149,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record request latency and add a Server-Timing header with the stage breakdown"""
+    timings = metrics.start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    metrics.observe(
+        "http_request_duration_seconds",
+        elapsed,
+        method=request.method,
+        path=route.path if route else "unmatched",
+        status=str(response.status_code)
+    )
+    if TIMING_HEADER:
+        response.headers["Server-Timing"] = server_timing(timings + [("total", elapsed)])
+    return response
+
+@app.middleware("http")
+async def identify_client(request: Request, call_next):
+    """Attribute the request's Gemini calls to its client (X-Client-Id, or its address) for fair sharing"""
+    client = request.headers.get("X-Client-Id") or (request.client.host if request.client else None)
+    with identity(client, INTERACTIVE):
+        return await call_next(request)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: stage durations, bytes, tokens and cache hits"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive", "uptime_seconds": round(time.monotonic() - STARTED_AT, 3)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: every required dependency is usable (503 with the failing ones otherwise)"""
+    checks = dependency_checks()
+    failing = [name for name, check in checks.items() if check["required"] and not check["ok"]]
+    return JSONResponse(
+        status_code=503 if failing else 200,
+        content={
+            "message": f"❌ Not ready: {', '.join(failing)}" if failing else "✅ Ready",
+            "ready": not failing,
+            "uptime_seconds": round(time.monotonic() - STARTED_AT, 3),
+            "checks": checks
+        }
+    )
+
 @app.get("/")
 async def root():
     return {"message": "PDF to Audio Converter API is running!", "status": "active"}
@@ -186,8 +1209,8 @@ async def root():
 async def get_token_usage_endpoint(days: int = 7):
     """Get token usage statistics"""
     try:
-        usage_history = get_token_usage(days)
-        today_usage = get_today_tokens()
+        usage_history = token_ledger.history(days)
+        today_usage = token_ledger.today()
         
         total_tokens_all_time = sum(item["total_tokens"] for item in usage_history)
         
@@ -196,8 +1219,10 @@ async def get_token_usage_endpoint(days: int = 7):
                 "today": today_usage,
                 "history": usage_history,
                 "total_all_time": total_tokens_all_time,
-                "daily_limit": 1000000,  # Adjust based on your plan
-                "limit_remaining": max(0, 1000000 - total_tokens_all_time)
+                "daily_limit": GEMINI_DAILY_TOKEN_BUDGET or None,
+                "limit_remaining": admission.remaining_today(),
+                "admission": admission.stats(),
+                "breakdown": token_ledger.breakdown(days)
             }
         )
     except Exception as e:
@@ -206,47 +1231,99 @@ async def get_token_usage_endpoint(days: int = 7):
             content={"message": f"❌ Error fetching token usage: {str(e)}"}
         )
 
-@app.post("/uploadfile/")
-async def pdf_upload(file: UploadFile):
-    if file.content_type != "application/pdf":
+@app.get("/cache_stats/")
+async def get_cache_stats():
+    """Get hit/miss statistics for the Gemini result cache, the audio segment store and slimmed PDFs, and how many requests were coalesced"""
+    return JSONResponse(content={
+        **result_cache.stats(),
+        "audio_segments": segment_store.stats() if segment_store else None,
+        "single_flight": {**flights.stats, "in_flight": flights.in_flight()},
+        "slim_pdfs": await run_in_threadpool(slim_pdfs.stats)
+    })
+
+def upload_body(field, multiple=False):
+    """OpenAPI description of a multipart body carrying PDFs as ``field``, which the upload endpoints parse themselves"""
+    file_schema = {"type": "string", "format": "binary"}
+    return {"requestBody": {"required": not multiple, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {field: {"type": "array", "items": file_schema} if multiple else file_schema}
+    }}}}}
+
+def receive_pdfs(request, field):
+    """Stream the PDFs of a multipart request into pdf/ as they arrive (see uploads.receive_uploads)"""
+    return aclosing(receive_uploads(request, field, "pdf", MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_BYTES))
+
+def store_upload(received):
+    """Add a received PDF to the catalog; returns the document"""
+    metrics.inc("bytes_total", received.size, stage="upload", direction="in")
+    return catalog.add_document(received.path, sha256=received.sha256, size=received.size, filename=received.filename)
+
+@app.post("/uploadfile/", openapi_extra=upload_body("file"))
+async def pdf_upload(request: Request):
+    try:
+        check_content_length(request, MAX_UPLOAD_BYTES)
+        with metrics.stage("upload"):
+            async with receive_pdfs(request, "file") as uploads:
+                received = await anext(uploads, None)
+        if received is None:
+            return JSONResponse(
+                status_code=400,
+                content={"message": "❌ No file received. Please upload a PDF file as 'file'."}
+            )
+        if received.content_type != "application/pdf":
+            return JSONResponse(
+                status_code=400,
+                content={"message": "❌ Invalid file type. Please upload a PDF file."}
+            )
+        if received.error:
+            raise received.error
+        doc, duplicate = store_upload(received), received.duplicate
+    except UploadTooLarge as e:
+        return JSONResponse(
+            status_code=413,
+            content={"message": f"❌ {e}."}
+        )
+    except InvalidUpload as e:
         return JSONResponse(
             status_code=400,
-            content={"message": "❌ Invalid file type. Please upload a PDF file."}
+            content={"message": f"❌ {e}."}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"❌ Error saving upload: {str(e)}"}
         )
 
-    file_path = os.path.join("pdf", file.filename)
-    file_copy = open(file_path, "wb")
-    file_copy.write(file.file.read())
-    file_copy.close()
     return JSONResponse(
         content={
-            "message": "✅ File uploaded successfully!",
-            "filename": file.filename
+            "message": "✅ File uploaded successfully!" if not duplicate else "✅ File already uploaded!",
+            "filename": received.filename,
+            "stored_as": os.path.basename(doc["path"]),
+            "document_id": doc["id"],
+            "file_size_bytes": doc["size_bytes"],
+            "duplicate": duplicate
         }
     )
 
 @app.get("/read_pdf/")
-async def read_pdf(file_name: str = None):
+async def read_pdf(file_name: str = None, document_id: str = None):
     try:
-        pdf_files = [os.path.join("pdf", f) for f in os.listdir("pdf") if f.lower().endswith(".pdf")]
-        if not pdf_files:
-            return JSONResponse(
-                status_code=404,
-                content={"message": "❌ No PDF files found in the 'pdf' folder."}
-            )
-        pdf_files.sort(key=os.path.getmtime, reverse=True)
-        last_pdf = pdf_files[0]
-        file_stat = os.stat(last_pdf)
-        file_size = file_stat.st_size
+        doc = resolve_document(document_id)
+        if not doc:
+            return missing_document_response(document_id, "❌ No PDF files found in the 'pdf' folder.")
+        file_size = doc["size_bytes"]
 
         return JSONResponse(
             content={
                 "message": "✅ Last uploaded PDF found successfully!",
-                "last_uploaded_pdf": os.path.basename(last_pdf),
-                "path": last_pdf,
+                "last_uploaded_pdf": doc["filename"],
+                "document_id": doc["id"],
+                "path": doc["path"],
                 "file_size_bytes": file_size,
                 "file_size_mb": round(file_size / (1024 * 1024), 2),
-                "total_pdf_files": len(pdf_files)
+                "analysis_status": doc["analysis_status"],
+                "audio_files": doc["audio"],
+                "total_pdf_files": catalog.document_count()
             }
         )
     except Exception as e:
@@ -256,81 +1333,34 @@ async def read_pdf(file_name: str = None):
         )
 
 @app.get("/analyze_pdf/")
-async def analyze_pdf(is_research_paper: bool = None):
+async def analyze_pdf(is_research_paper: bool = None, document_id: str = None):
     try:
-        pdf_info = await read_pdf()
+        doc = resolve_document(document_id)
+        if not doc:
+            return missing_document_response(document_id, "❌ No PDF files found to analyze.")
+        filename = doc["filename"]
 
-        if hasattr(pdf_info, 'status_code') and pdf_info.status_code != 200:
-            return pdf_info
-
-        pdf_data = pdf_info.body.decode() if hasattr(pdf_info, 'body') else None
-        if pdf_data:
-            pdf_json = json.loads(pdf_data)
-            pdf_file_path = pdf_json.get('path')
-            filename = pdf_json.get('last_uploaded_pdf')
-        else:
-            pdf_files = [os.path.join("pdf", f) for f in os.listdir("pdf") if f.lower().endswith(".pdf")]
-            if not pdf_files:
-                return JSONResponse(
-                    status_code=404,
-                    content={"message": "❌ No PDF files found to analyze."}
-                )
-            pdf_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-            pdf_file_path = pdf_files[0]
-            filename = os.path.basename(pdf_file_path)
-
-        filepath = pathlib.Path(pdf_file_path)
-
-        prompt = """
-        PLEASE ANALYZE THE CONTENT OF THE PDF.
-        Determine if this is a research paper or not.
-        
-        Look for these characteristics of research papers:
-        - Abstract section
-        - Introduction, methodology, results, conclusion sections
-        - References/bibliography
-        - Academic writing style
-        - Citations and references to other papers
-        
-        Respond with ONLY:
-        - "YES" if it is a research paper
-        - "NO" if it is not a research paper
-        """
-
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[
-                types.Part.from_bytes(
-                    data=filepath.read_bytes(),
-                    mime_type='application/pdf',
-                ),
-                prompt
-            ]
-        )
-
-        # Track token usage
-        if hasattr(response, 'usage_metadata'):
-            add_tokens(
-                input_tokens=response.usage_metadata.input_tokens,
-                output_tokens=response.usage_metadata.output_tokens
-            )
-
-        ai_response = response.text.strip().upper()
-        is_research_paper = "YES" in ai_response
+        analysis = await classify_document(doc)
 
         return JSONResponse(
             content={
                 "message": "✅ PDF analysis completed successfully!",
                 "filename": filename,
-                "is_research_paper": is_research_paper,
-                "ai_response": response.text.strip(),
+                "document_id": doc["id"],
+                "is_research_paper": analysis["is_research_paper"],
+                "ai_response": analysis["ai_response"],
+                "decided_by": analysis["decided_by"],
+                "heuristic_score": analysis["heuristic_score"],
+                "cache_hit": analysis["cache_hit"],
                 "analysis_details": {
                     "file_analyzed": filename,
-                    "file_size_mb": round(os.path.getsize(pdf_file_path) / (1024 * 1024), 2)
+                    "file_size_mb": round(doc["size_bytes"] / (1024 * 1024), 2)
                 }
             }
         )
 
+    except PipelineError as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.message})
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -338,264 +1368,493 @@ async def analyze_pdf(is_research_paper: bool = None):
         )
 
 @app.get("/summarize_pdf/")
-async def summarize_pdf():
+async def summarize_pdf(document_id: str = None, mode: str = None):
     try:
-        pdf_info = await read_pdf()
+        doc = resolve_document(document_id)
+        if not doc:
+            return missing_document_response(document_id, "❌ No PDF files found to summarize.")
+        filename = doc["filename"]
 
-        if hasattr(pdf_info, 'status_code') and pdf_info.status_code != 200:
-            return pdf_info
+        invalid = invalid_mode_response(mode)
+        if invalid:
+            return invalid
 
-        pdf_data = pdf_info.body.decode() if hasattr(pdf_info, 'body') else None
-        if pdf_data:
-            pdf_json = json.loads(pdf_data)
-            pdf_file_path = pdf_json.get('path')
-            filename = pdf_json.get('last_uploaded_pdf')
-        else:
-            pdf_files = [os.path.join("pdf", f) for f in os.listdir("pdf") if f.lower().endswith(".pdf")]
-            if not pdf_files:
-                return JSONResponse(
-                    status_code=404,
-                    content={"message": "❌ No PDF files found to summarize."}
-                )
-            pdf_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-            pdf_file_path = pdf_files[0]
-            filename = os.path.basename(pdf_file_path)
-
-        filepath = pathlib.Path(pdf_file_path)
-
-        
-        analysis_result = await analyze_pdf()
-
-        
-        try:
-            if hasattr(analysis_result, 'body') and analysis_result.body:
-                body_content = analysis_result.body
-                if isinstance(body_content, bytes):
-                    body_content = body_content.decode()
-                analysis_data = json.loads(body_content)
-                is_research_paper = analysis_data.get('is_research_paper', False)
-            else:
-                response_content = getattr(analysis_result, '_content', None)
-                if response_content:
-                    if isinstance(response_content, bytes):
-                        response_content = response_content.decode()
-                    analysis_data = json.loads(response_content)
-                    is_research_paper = analysis_data.get('is_research_paper', False)
-                else:
-                    is_research_paper = False
-        except Exception as parse_error:
-            print(f"Error parsing analysis result: {parse_error}")
-            return JSONResponse(
-                status_code=400,
-                content={"message": f"❌ PDF validation failed. Not a valid PDF file."}
-            )
-        
-        
-        if not is_research_paper:
-            return JSONResponse(
-                status_code=400,
-                content={"message": "❌ PDF is not a valid research paper. Summarization skipped to save tokens."}
-            )
-
-        if is_research_paper:
-            prompt = """
-            PLEASE SUMMARIZE THE CONTENT OF THIS RESEARCH PAPER PDF IN A WAY THAT WOULD SUIT AN AUDIOBOOK.
-            The summary should be engaging, clear, and concise, highlighting the key points and findings.
-            
-            Guidelines for Research Papers:
-            - Do not use AI terms like "this is a research paper" or "as an AI model"
-            - Summarize like a human would for an audiobook
-            - Be straightforward and conversational
-            - Explain each point well with clear transitions
-            - Explain scientific terms very clearly and simply
-            - Use examples where necessary to illustrate complex concepts
-            - Cover: background, methodology, key findings, conclusions, and implications
-            - Structure it with clear sections and flow
-            - Make it engaging for audio listening
-            
-            Format the summary with clear sections and smooth transitions between ideas.
-            """
-        else:
-            prompt = """
-            PLEASE SUMMARIZE THE CONTENT OF THIS PDF DOCUMENT IN A WAY THAT WOULD SUIT AN AUDIOBOOK.
-            The summary should be engaging, clear, and concise, highlighting the main topics and key information.
-            
-            Guidelines for General Documents:
-            - Do not use AI terms or mention that this is an AI summary
-            - Summarize like a human would for an audiobook
-            - Be straightforward and conversational
-            - Explain each main point clearly with smooth transitions
-            - Break down complex topics into simple, understandable language
-            - Use examples where helpful to illustrate concepts
-            - Structure it logically with clear flow between topics
-            - Make it engaging and easy to follow for audio listening
-            - Focus on the most important information and practical insights
-            
-            Format the summary with clear sections and smooth transitions between ideas.
-            """
-
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[
-                types.Part.from_bytes(
-                    data=filepath.read_bytes(),
-                    mime_type='application/pdf',
-                ),
-                prompt
-            ]
-        )
-
-        # Track token usage
-        if hasattr(response, 'usage_metadata'):
-            add_tokens(
-                input_tokens=response.usage_metadata.input_tokens,
-                output_tokens=response.usage_metadata.output_tokens
-            )
+        result = await summarize_document(doc, mode)
+        summary = result["summary"]
 
         return JSONResponse(
             content={
                 "message": "✅ PDF summarized successfully!",
                 "filename": filename,
-                "is_research_paper": is_research_paper,
-                "summary": response.text.strip(),
+                "document_id": doc["id"],
+                "is_research_paper": result["is_research_paper"],
+                "summary": summary,
+                "summary_mode": result["summary_mode"],
+                "cache_hit": result["cache_hit"],
                 "summary_details": {
-                    "word_count": len(response.text.split()),
+                    "word_count": len(summary.split()),
                     "file_analyzed": filename,
-                    "file_size_mb": round(os.path.getsize(pdf_file_path) / (1024 * 1024), 2)
+                    "file_size_mb": round(doc["size_bytes"] / (1024 * 1024), 2)
                 }
             }
         )
 
+    except PipelineError as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.message})
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"message": f"❌ Error summarizing PDF: {str(e)}"}
         )
 
-@app.get("/generate_audio_book/")
-async def generate_audio_book():
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def summary_events(doc, mode, tts_engine):
+    """Server-Sent Events for a summary streamed as Gemini writes it, and optionally its audio book"""
+    pieces = asyncio.Queue()
 
+    async def summarize():
+        if tts_engine:
+            return await summarize_with_audio(doc, tts_engine, mode, on_text=pieces.put_nowait)
+        return await summarize_document(doc, mode, on_text=pieces.put_nowait), None, None
+
+    task = asyncio.ensure_future(summarize())
     try:
- 
-        os.makedirs("audio", exist_ok=True)
-        
+        start = {"document_id": doc["id"], "filename": doc["filename"]}
+        if tts_engine:
+            audio_filename = audio_filename_for(doc["id"])
+            start["stream_url"] = f"/play_audio_book/?stream=true&audio_file={audio_filename}"
+        yield sse_event("start", start)
 
-        summary_response = await summarize_pdf()
-        
+        while not task.done() or not pieces.empty():
+            piece = asyncio.ensure_future(pieces.get())
+            await asyncio.wait({piece, task}, return_when=asyncio.FIRST_COMPLETED)
+            if piece.done():
+                yield sse_event("summary_delta", {"text": piece.result()})
+            else:
+                piece.cancel()
 
-        if hasattr(summary_response, 'body'):
+        summary_data, audio_path, synthesis = task.result()
+        summary = summary_data["summary"]
+        yield sse_event("summary_done", {
+            "is_research_paper": summary_data["is_research_paper"],
+            "summary_mode": summary_data["summary_mode"],
+            "cache_hit": summary_data["cache_hit"],
+            "word_count": len(summary.split())
+        })
+        if audio_path:
+            audio_filename = os.path.basename(audio_path)
+            yield sse_event("audio_done", {
+                "audio_file": audio_filename,
+                "tts_engine": tts_engine.name,
+                "segments": synthesis["chunks"],
+                "segments_reused": synthesis["reused"],
+                "download_url": f"/download_audio_book/?audio_file={audio_filename}"
+            })
+        yield sse_event("done", {"message": "✅ PDF summarized successfully!"})
+    except PipelineError as e:
+        yield sse_event("error", {"message": e.message, "status_code": e.status_code})
+    except Exception as e:
+        yield sse_event("error", {"message": f"❌ Error summarizing PDF: {str(e)}", "status_code": 500})
+    finally:
+        if not task.done():
+            task.cancel()
 
-            summary_data = json.loads(summary_response.body.decode())
-        else:
+@app.get("/summarize_pdf/stream")
+async def summarize_pdf_stream(document_id: str = None, mode: str = None, audio: bool = False, engine: str = None):
+    """Stream the summary over Server-Sent Events as Gemini generates it.
 
-            summary_data = summary_response
-        
+    With ``audio=true`` each finished paragraph is also synthesized right away,
+    so the audio book is ready shortly after the summary; it can be listened to
+    while it is produced through the ``stream_url`` in the ``start`` event.
+    """
+    try:
+        doc = resolve_document(document_id)
+        if not doc:
+            return missing_document_response(document_id, "❌ No PDF files found to summarize.")
 
-        if 'summary' not in summary_data:
-            return JSONResponse(
-                status_code=400,
-                content={"message": "❌ Failed to get summary for audio generation"}
-            )
-        
-        text = summary_data['summary']
-        filename = summary_data.get('filename', 'unknown.pdf')
-        
+        invalid = invalid_mode_response(mode)
+        if invalid:
+            return invalid
+        tts_engine = select_tts_engine(engine) if audio else None
 
-        language = 'en'
-        myobj = gTTS(text=text, lang=language, slow=False)
-        
+        return StreamingResponse(
+            summary_events(doc, mode, tts_engine),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except PipelineError as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.message})
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"❌ Error summarizing PDF: {str(e)}"}
+        )
+
+@app.get("/generate_audio_book/")
+async def generate_audio_book(document_id: str = None, engine: str = None):
+
+    try:
+        doc = resolve_document(document_id)
+        if not doc:
+            return missing_document_response(document_id, "❌ No PDF files found to summarize.")
+
+        result = await run_audiobook_pipeline(doc, engine=engine)
 
-        audio_filename = f"audiobook_{filename.replace('.pdf', '')}.mp3"
-        audio_path = os.path.join("audio", audio_filename)
-        
-        myobj.save(audio_path)
-        
         return JSONResponse(
             content={
                 "message": "✅ Audio book generated successfully!",
-                "source_pdf": filename,
-                "audio_file": audio_filename,
-                "audio_path": audio_path,
-                "text_length": len(text),
-                "word_count": len(text.split()),
-                "download_url": f"/download_audio_book/{audio_filename}"
+                **result
             }
         )
-        
+
+    except PipelineError as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.message})
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"message": f"❌ Error generating audio book: {str(e)}"}
         )
 
-@app.get("/download_audio_book/")
-async def download_audio_book():
+@app.post("/generate_audio_book/")
+async def submit_audio_book_job(document_id: str = None, engine: str = None):
+    """Queue audiobook generation for a document (the latest PDF by default) and return a job id immediately"""
+    try:
+        doc = resolve_document(document_id)
+        if not doc:
+            return missing_document_response(document_id, "❌ No PDF files found to summarize.")
+
+        tts_engine = select_tts_engine(engine)
+        job = await job_queue.submit("audiobook", {
+            "document_id": doc["id"],
+            "tts_engine": tts_engine.name,
+            "client": current_identity()[0]
+        })
+
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "✅ Audio book generation queued!",
+                "job_id": job["id"],
+                "document_id": doc["id"],
+                "source_pdf": doc["filename"],
+                "status_url": f"/jobs/{job['id']}",
+                "tts_engine": tts_engine.name,
+                "stream_url": f"/play_audio_book/?stream=true&audio_file={audio_filename_for(doc['id'])}"
+            }
+        )
+    except PipelineError as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.message})
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"❌ Error queuing audio book job: {str(e)}"}
+        )
 
+@app.get("/admin/storage")
+async def get_storage_usage():
+    """Disk usage of pdf/ and audio/ against their quotas"""
+    return JSONResponse(content={
+        **storage.usage(),
+        "renditions": await run_in_threadpool(renditions.stats),
+        "pinned_documents": sorted(await run_in_threadpool(pinned_documents))
+    })
+
+@app.post("/admin/storage/compact")
+async def compact_storage():
+    """Delete least recently accessed files now until pdf/ and audio/ are within their quotas"""
     try:
+        evicted = await run_in_threadpool(storage.compact)
+        return JSONResponse(content={
+            "message": f"✅ Compaction finished, {len(evicted)} files deleted.",
+            "evicted": evicted,
+            "usage": storage.usage()
+        })
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"❌ Error compacting storage: {str(e)}"}
+        )
+
+@app.get("/jobs/")
+async def list_jobs(limit: int = 50):
+    """List the most recent background jobs"""
+    return JSONResponse(content={"jobs": job_store.list(limit), "pending": job_queue.pending()})
 
-        if not os.path.exists("audio"):
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the current stage and progress of a background job"""
+    job = job_store.get(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"message": f"❌ Job {job_id} not found."}
+        )
+    return JSONResponse(content=job)
+
+@app.post("/batch/", openapi_extra=upload_body("files", multiple=True))
+async def submit_batch(
+    request: Request,
+    document_ids: List[str] = Query(None),
+    parallelism: int = None,
+    engine: str = None
+):
+    """Queue audiobook generation for many PDFs at once.
+
+    Upload PDFs as ``files`` and/or name existing documents with ``document_ids``
+    (repeated or comma-separated). Up to ``parallelism`` documents of the batch
+    are processed at the same time. Poll ``/batch/{batch_id}`` for per-document status.
+    """
+    try:
+        tts_engine = select_tts_engine(engine)
+        if parallelism is not None and not 1 <= parallelism <= BATCH_MAX_PARALLELISM:
             return JSONResponse(
-                status_code=404,
-                content={"message": "❌ No audio files found. Please generate audio book first."}
+                status_code=400,
+                content={"message": f"❌ parallelism must be between 1 and {BATCH_MAX_PARALLELISM}."}
             )
-        
 
-        audio_files = [f for f in os.listdir("audio") if f.endswith(".mp3")]
-        
-        if not audio_files:
+        items = []
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            with metrics.stage("upload"):
+                async with receive_pdfs(request, "files") as uploads:
+                    async for received in uploads:
+                        item = {"document_id": None, "filename": received.filename, "status": QUEUED, "stage": QUEUED}
+                        if received.content_type != "application/pdf":
+                            item.update(status=FAILED, stage=FAILED, error="❌ Invalid file type. Please upload a PDF file.")
+                        elif received.error:
+                            item.update(status=FAILED, stage=FAILED, error=f"❌ {received.error}.")
+                        else:
+                            item["document_id"] = store_upload(received)["id"]
+                        items.append(item)
+
+        for value in document_ids or []:
+            for document_id in filter(None, (part.strip() for part in value.split(","))):
+                doc = catalog.get(document_id)
+                item = {"document_id": document_id, "filename": doc["filename"] if doc else None,
+                        "status": QUEUED, "stage": QUEUED}
+                if not doc:
+                    item.update(status=FAILED, stage=FAILED, error=f"❌ Document {document_id} not found.")
+                items.append(item)
+
+        if not items:
             return JSONResponse(
-                status_code=404,
-                content={"message": "❌ No audio files found. Please generate audio book first."}
+                status_code=400,
+                content={"message": "❌ Upload PDFs as files or pass document_ids."}
             )
-        
 
-        audio_files.sort(key=lambda x: os.path.getmtime(os.path.join("audio", x)), reverse=True)
-        latest_audio = audio_files[0]
-        audio_path = os.path.join("audio", latest_audio)
-        
+        job = await job_queue.submit("batch", {
+            "documents": items,
+            "parallelism": parallelism or BATCH_PARALLELISM,
+            "tts_engine": tts_engine.name,
+            "client": current_identity()[0]
+        })
 
-        return FileResponse(
-            path=audio_path,
-            filename=latest_audio,
-            media_type='audio/mpeg',
-            headers={"Content-Disposition": f"attachment; filename={latest_audio}"}
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": f"✅ Batch of {len(items)} documents queued!",
+                "batch_id": job["id"],
+                "documents": items,
+                "status_url": f"/batch/{job['id']}"
+            }
         )
-        
+    except PipelineError as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.message})
+    except InvalidUpload as e:
+        return JSONResponse(status_code=400, content={"message": f"❌ {e}."})
     except Exception as e:
         return JSONResponse(
             status_code=500,
-            content={"message": f"❌ Error downloading audio book: {str(e)}"}
+            content={"message": f"❌ Error queuing batch: {str(e)}"}
         )
 
-@app.get("/play_audio_book/")
-async def play_audio_book():
+@app.get("/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """Report the status of each document in a batch"""
+    job = job_store.get(batch_id)
+    if not job or job["kind"] != "batch":
+        return JSONResponse(
+            status_code=404,
+            content={"message": f"❌ Batch {batch_id} not found."}
+        )
+
+    documents = (job["result"] or job["params"])["documents"]
+    counts = {status: 0 for status in (QUEUED, RUNNING, COMPLETED, FAILED)}
+    for item in documents:
+        counts[item["status"]] += 1
+    return JSONResponse(
+        content={
+            "batch_id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "counts": counts,
+            "documents": documents,
+            "error": job["error"]
+        }
+    )
+
+def resolve_audio(audio_file=None, document_id=None):
+    """Look up an audio book by file name or document, or the latest one"""
+    if audio_file:
+        audio = catalog.get_audio(os.path.basename(audio_file))
+    else:
+        audio = catalog.latest_audio(document_id)
+    if audio:
+        catalog.touch(audio_file=audio["filename"])
+    return audio
+
+async def audio_response(request, audio, disposition, audio_format=None, bitrate=None):
+    """Serve an audio book with byte-range support and a strong ETag.
+
+    The format comes from ``audio_format``, else the Accept header (preferring
+    AUDIO_FORMAT). The stored MP3 is sent as is; any other format or bitrate is
+    a cached rendition made by ffmpeg. A rendition the request didn't name is
+    only sent once it exists: until then the MP3 is, and the rendition is made
+    in the background, so a browser never waits for (or fails on) a transcode.
+    """
+    sha256 = audio.get("sha256")
+    if not sha256:
+        sha256 = await run_in_threadpool(file_sha256, audio["path"])
+        catalog.set_audio_hash(audio["filename"], sha256)
+
+    negotiated = audio_format is None
+    if negotiated:
+        formats = FORMATS if renditions.available() else ["mp3"]
+        preferred = AUDIO_FORMAT if AUDIO_FORMAT in formats else "mp3"
+        audio_format = negotiate_format(request.headers.get("accept"), formats, preferred)
+    bitrate = bitrate or RENDITION_BITRATES.get(audio_format)
+
+    path = None
+    if audio_format != "mp3" or bitrate:
+        if not negotiated:
+            with metrics.stage("transcode", format=audio_format):
+                path = await renditions.get(audio["path"], sha256, audio_format, bitrate)
+        else:
+            path = renditions.cached(sha256, audio_format, bitrate)
+            if path is None and renditions.available():
+                renditions.prepare(audio["path"], sha256, audio_format, bitrate)
+
+    name = os.path.splitext(audio["filename"])[0]
+    if path is None:
+        audio_format, path, etag = "mp3", audio["path"], sha256
+    else:
+        etag = f"{sha256}-{audio_format}-{bitrate}"
+    headers = {
+        "Content-Disposition": f"{disposition}; filename={name}.{FORMATS[audio_format]['ext']}",
+        "Vary": "Accept"
+    }
+    return file_response(request.headers, path, etag, FORMATS[audio_format]["media_type"], headers=headers)
+
+def invalid_rendition_response(audio_format, bitrate):
+    """400 response for an unknown format or bad bitrate, or None when both are fine"""
+    if audio_format is not None and audio_format not in FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"❌ Invalid format. Use one of: {', '.join(FORMATS)}."}
+        )
+    if bitrate is not None and not valid_bitrate(bitrate):
+        return JSONResponse(
+            status_code=400,
+            content={"message": "❌ Invalid bitrate. Use a value like '24k' between 6k and 320k."}
+        )
+    return None
+
+@app.get("/download_audio_book/")
+async def download_audio_book(
+    request: Request, audio_file: str = None, document_id: str = None, format: str = None, bitrate: str = None
+):
 
     try:
+        invalid = invalid_rendition_response(format, bitrate)
+        if invalid:
+            return invalid
 
-        if not os.path.exists("audio"):
+        audio = resolve_audio(audio_file, document_id)
+        if not audio:
             return JSONResponse(
                 status_code=404,
                 content={"message": "❌ No audio files found. Please generate audio book first."}
             )
 
-        audio_files = [f for f in os.listdir("audio") if f.endswith(".mp3")]
-        
-        if not audio_files:
+        return await audio_response(request, audio, "attachment", format, bitrate)
+
+    except TranscodeError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"message": f"❌ Error converting audio book: {str(e)}"}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"❌ Error downloading audio book: {str(e)}"}
+        )
+
+async def stream_live_audio(reader):
+    """Yield a book's MP3 bytes as they are synthesized, until synthesis finishes"""
+    try:
+        while True:
+            data, done, error = await run_in_threadpool(reader.read)
+            if data:
+                yield data
+            if done:
+                if error:
+                    print(f"⚠️ Streaming stopped, synthesis of {reader.audio_file} failed: {error}")
+                return
+            if not data:
+                await asyncio.sleep(LIVE_AUDIO_POLL_SECONDS)
+    finally:
+        reader.close()
+
+@app.get("/play_audio_book/")
+async def play_audio_book(
+    request: Request,
+    stream: bool = False,
+    audio_file: str = None,
+    document_id: str = None,
+    format: str = None,
+    bitrate: str = None
+):
+    """Play the latest audio book.
+
+    With ``stream=true`` a book that is still being synthesized is streamed (as
+    MP3) from its first finished chunk, and the connection stays open until the
+    rest arrives. ``format`` and ``bitrate`` pick a rendition of a finished book.
+    """
+
+    try:
+        invalid = invalid_rendition_response(format, bitrate)
+        if invalid:
+            return invalid
+
+        if stream:
+            if audio_file or document_id:
+                live_file = os.path.basename(audio_file or audio_filename_for(document_id))
+            else:
+                live_file = next(iter(live_audio_files("audio")), None)
+            reader = LiveAudioReader.open("audio", live_file) if live_file else None
+            if reader:
+                return StreamingResponse(
+                    stream_live_audio(reader),
+                    media_type='audio/mpeg',
+                    headers={"Cache-Control": "no-cache"}
+                )
+
+        audio = resolve_audio(audio_file, document_id)
+        if not audio:
             return JSONResponse(
                 status_code=404,
                 content={"message": "❌ No audio files found. Please generate audio book first."}
             )
 
-        audio_files.sort(key=lambda x: os.path.getmtime(os.path.join("audio", x)), reverse=True)
-        latest_audio = audio_files[0]
-        audio_path = os.path.join("audio", latest_audio)
+        return await audio_response(request, audio, "inline", format, bitrate)
 
-        return FileResponse(
-            path=audio_path,
-            filename=latest_audio,
-            media_type='audio/mpeg'
+    except TranscodeError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"message": f"❌ Error converting audio book: {str(e)}"}
         )
-        
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -0,0 +1,128 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Counters, histograms and gauges rendered in the Prometheus text format"""
+
+    def __init__(self, namespace="pdf_audiobook", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._histograms = defaultdict(dict)
+        self._gauges = {}
+
+    def _name(self, name):
+        return f"{self.namespace}_{name}"
+
+    def describe(self, name, help_text):
+        self._help[self._name(name)] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        with self._lock:
+            self._counters[self._name(name)][_label_key(labels)] += amount
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[self._name(name)].get(key)
+            if series is None:
+                series = self._histograms[self._name(name)][key] = {
+                    "buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0
+                }
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def gauge(self, name, read, help_text=None):
+        """Register a gauge whose value is read from a callable at scrape time"""
+        self._gauges[self._name(name)] = read
+        if help_text:
+            self.describe(name, help_text)
+
+    @contextmanager
+    def stage(self, stage, **labels):
+        """Time a pipeline stage into ``stage_duration_seconds`` and the request's timing breakdown"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started, **labels)
+
+    def record_stage(self, stage, elapsed, **labels):
+        """Record a stage duration measured elsewhere"""
+        self.observe("stage_duration_seconds", elapsed, stage=stage, **labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+    def start_request(self):
+        """Start collecting stage timings for the current request; returns the list they are added to"""
+        timings = []
+        _request_timings.set(timings)
+        return timings
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, data in sorted(series.items()):
+                    for bound, count in zip(self.buckets, data["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {data['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {data['sum']:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {data['count']}")
+        for name, read in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                print(f"⚠️ Error reading gauge {name}: {e}")
+                continue
+            self._header(lines, name, "gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def server_timing(timings):
+    """Format stage timings as a Server-Timing header value"""
+    totals = defaultdict(float)
+    for stage, elapsed in timings:
+        totals[stage] += elapsed
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items())
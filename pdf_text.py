@@ -0,0 +1,59 @@
+def _reader(path):
+    # pypdf is imported on first use to keep it out of application startup
+    from pypdf import PdfReader
+
+    return PdfReader(path)
+
+
+def page_count(path):
+    """Number of pages in a PDF"""
+    return len(_reader(path).pages)
+
+
+def extract_pages(path, first=None, last=None):
+    """Text of pages first..last (1-based, inclusive) as a list of strings, one per page.
+
+    Pages that fail to extract come back as empty strings.
+    """
+    return _page_texts(_reader(path), first, last)
+
+
+def extract_ends(path, pages):
+    """Text of the first and of the last ``pages`` pages of a PDF, read with one parse.
+
+    Returns two lists of strings; the last pages don't overlap the first ones,
+    so a short document has an empty second list.
+    """
+    reader = _reader(path)
+    total = len(reader.pages)
+    first = _page_texts(reader, 1, min(total, pages))
+    last_start = max(pages + 1, total - pages + 1)
+    last = _page_texts(reader, last_start, total) if last_start <= total else []
+    return first, last
+
+
+def _page_texts(reader, first=None, last=None):
+    total = len(reader.pages)
+    first = max(1, first or 1)
+    last = min(total, last or total)
+    texts = []
+    for index in range(first - 1, last):
+        try:
+            texts.append(reader.pages[index].extract_text() or "")
+        except Exception as e:
+            print(f"⚠️ Could not extract text from page {index + 1}: {e}")
+            texts.append("")
+    return texts
+
+
+def iter_page_ranges(path, pages_per_chunk):
+    """Split a PDF's text into chunks of consecutive pages, extracting one chunk at a time.
+
+    Yields ``(first_page, last_page, text)`` tuples covering the whole
+    document, so a caller can use each chunk while the next is extracted.
+    """
+    reader = _reader(path)
+    total = len(reader.pages)
+    for first in range(1, total + 1, pages_per_chunk):
+        last = min(total, first + pages_per_chunk - 1)
+        yield first, last, "\n\n".join(_page_texts(reader, first, last)).strip()
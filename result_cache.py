@@ -0,0 +1,152 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from db import connect
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of a document's bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def prompt_version(prompt: str) -> str:
+    """Short fingerprint of a prompt so edited prompts don't reuse stale results"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def make_cache_key(kind: str, pdf_hash: str, model: str, version: str) -> str:
+    """Build the cache key for one result kind ("analysis", "summary", ...)"""
+    return f"{kind}:{model}:{version}:{pdf_hash}"
+
+
+class ResultCache:
+    """Two-tier cache of Gemini results.
+
+    Results live in an in-memory LRU for fast repeat lookups and in a SQLite
+    table so they survive restarts. Both tiers expire entries after
+    ``ttl_seconds``; the memory tier is bounded by ``max_memory_entries`` and
+    the disk tier by ``max_disk_entries`` (least recently used rows go first).
+    """
+
+    def __init__(self, db_path, max_memory_entries=256, max_disk_entries=5000, ttl_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._conn = connect(db_path)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS result_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_accessed ON result_cache(accessed_at)")
+        self._conn.commit()
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM result_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            raw_value, created_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["evictions"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            value = json.loads(raw_value)
+            self._remember(key, created_at, value)
+            self._stats["disk_hits"] += 1
+            return value
+
+    def set(self, key, value):
+        """Store a JSON-serializable value under key in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._conn.execute("""
+                INSERT INTO result_cache (key, value, created_at, accessed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    created_at = excluded.created_at,
+                    accessed_at = excluded.accessed_at
+            """, (key, json.dumps(value), now, now))
+            self._evict_disk(now)
+            self._conn.commit()
+            self._stats["stores"] += 1
+
+    def _remember(self, key, created_at, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now):
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._stats["evictions"] += max(cursor.rowcount, 0)
+
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            cursor = self._conn.execute("""
+                DELETE FROM result_cache WHERE key IN (
+                    SELECT key FROM result_cache ORDER BY accessed_at ASC LIMIT ?
+                )
+            """, (overflow,))
+            self._stats["evictions"] += max(cursor.rowcount, 0)
+
+    def stats(self):
+        """Hit/miss counters and current tier sizes"""
+        with self._lock:
+            (disk_entries,) = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def clear(self):
+        """Drop every cached result from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM result_cache")
+            self._conn.commit()
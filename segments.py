@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from db import connect
+
+
+def segment_key(text, lang, voice):
+    """Content address of a synthesized segment: normalized text plus language and voice settings"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{voice}\0{lang}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class SegmentStore:
+    """Content-addressed store of synthesized MP3 segments shared by every book.
+
+    Segments are files under ``directory`` named by their key, indexed in a
+    SQLite table that records their size and last use. When the store grows
+    past ``max_bytes`` the least recently used segments are deleted. The size
+    is always taken from the index, so worker processes sharing the directory
+    keep it within budget together.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._conn = connect(os.path.join(directory, "index.db"))
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_accessed ON segments(accessed_at)")
+        self._conn.commit()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def get(self, key):
+        """MP3 bytes of a stored segment, or None"""
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+                self._forget(key)
+            return None
+
+        with self._lock:
+            self._stats["hits"] += 1
+            self._conn.execute("UPDATE segments SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return data
+
+    def put(self, key, data):
+        """Store a segment, then evict least recently used ones if over budget"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".seg-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO segments (key, size, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, len(data), now, now)
+            )
+            self._stats["stores"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _forget(self, key):
+        self._conn.execute("DELETE FROM segments WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+
+    def _evict(self):
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM segments ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self._conn.execute("DELETE FROM segments WHERE key = ?", (key,))
+            total -= size
+            self._stats["evictions"] += 1
+
+    def stats(self):
+        """Hit/miss counters and the size of the store"""
+        with self._lock:
+            (segments,) = self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "segments": segments,
+                "bytes": self._total_bytes(),
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,76 @@
+import asyncio
+
+
+class _Flight:
+    """One in-flight call: its task and whoever listens to what it emits"""
+
+    def __init__(self):
+        self.task = None
+        self.events = []
+        self.listeners = []
+
+    def emit(self, *event):
+        """Pass an event (a piece of streamed text, a progress update) to every listener"""
+        self.events.append(event)
+        for listener in list(self.listeners):
+            try:
+                listener(*event)
+            except Exception as e:
+                # A failing listener (e.g. a client that went away) must not break the others
+                print(f"⚠️ Dropping single-flight listener: {e}")
+                if listener in self.listeners:
+                    self.listeners.remove(listener)
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one.
+
+    The first caller for a key starts ``func(emit)`` as a task of its own;
+    callers arriving while it runs wait for the same task and get the same
+    result (or exception), which they must treat as read-only. Every caller
+    waits through ``asyncio.shield``, so a caller that is cancelled, say
+    because its client disconnected, stops waiting without cancelling the
+    work the others need; the work also finishes if every caller has gone,
+    so its result still reaches the caches.
+
+    ``func`` may call ``emit(*event)`` to stream events. A caller's
+    ``listener`` receives all of them, including the ones emitted before it
+    joined.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def in_flight(self, key=None):
+        """Whether a call for key is running, or how many calls run when no key is given"""
+        return key in self._flights if key is not None else len(self._flights)
+
+    async def run(self, key, func, listener=None):
+        """Run ``func(emit)`` once for all concurrent callers with the same key and return its result"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            self.stats["leaders"] += 1
+            flight.task = asyncio.ensure_future(func(flight.emit))
+            flight.task.add_done_callback(lambda task: self._finished(key, flight, task))
+        else:
+            self.stats["followers"] += 1
+            if listener:
+                for event in flight.events:
+                    listener(*event)
+
+        if listener:
+            flight.listeners.append(listener)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            if listener in flight.listeners:
+                flight.listeners.remove(listener)
+
+    def _finished(self, key, flight, task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,167 @@
+import os
+import pathlib
+import re
+import tempfile
+import threading
+
+from file_cache import FileCache
+
+# Font names selected by a Tf operator in a content stream
+_FONT_OPERATOR = re.compile(rb'/([^\s/\[\]()<>{}%]+)\s+[-+.\d]+\s+Tf\b')
+
+
+def _used_fonts(page):
+    """Resource names of the fonts a page's content stream selects"""
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b""
+    return {"/" + name.decode("latin-1") for name in _FONT_OPERATOR.findall(data)}
+
+
+def _has_forms(resources):
+    """Whether the resources include form XObjects, which may use the page's fonts from their own streams"""
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        return False
+    return any(xobject.get_object().get("/Subtype") == "/Form" for xobject in xobjects.get_object().values())
+
+
+def slim_pdf(source_path, output_path, min_text_chars=100):
+    """Write a text-focused copy of a PDF for the model; returns what was removed.
+
+    Pages with at least ``min_text_chars`` characters of extractable text lose
+    their images, which add nothing to a summary of the text. Pages with less
+    (scans, figures) keep them, since the model needs them to read the page.
+    Fonts the page doesn't select and page thumbnails are dropped, content
+    streams are compressed and duplicate or orphaned objects removed. With
+    pikepdf installed the result is also linearized.
+    """
+    # pypdf is imported on first use to keep it out of application startup
+    from pypdf import PdfWriter, ObjectDeletionFlag
+    from pypdf.generic import NameObject
+
+    writer = PdfWriter(clone_from=source_path)
+    removed = {"text_pages": 0, "fonts": 0, "thumbnails": 0}
+    font_dicts = {}
+    for page in writer.pages:
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        if len(text.strip()) >= min_text_chars and "/Resources" in page:
+            writer.remove_objects_from_page(
+                page, [ObjectDeletionFlag.XOBJECT_IMAGES, ObjectDeletionFlag.INLINE_IMAGES]
+            )
+            removed["text_pages"] += 1
+
+        if "/Thumb" in page:
+            del page[NameObject("/Thumb")]
+            removed["thumbnails"] += 1
+
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources is not None else None
+        if resources is not None and "/Font" in resources:
+            # Pages may share one font dictionary, so collect what every page selects before pruning it
+            fonts = resources["/Font"].get_object()
+            font_dicts.setdefault(id(fonts), [fonts, set(), True])
+            if _has_forms(resources):
+                font_dicts[id(fonts)][2] = False
+            else:
+                font_dicts[id(fonts)][1].update(_used_fonts(page))
+
+        page.compress_content_streams()
+
+    for fonts, used, prunable in font_dicts.values():
+        if prunable:
+            for name in [name for name in fonts if name not in used]:
+                del fonts[name]
+                removed["fonts"] += 1
+
+    writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+    with open(output_path, "wb") as f:
+        writer.write(f)
+
+    try:
+        import pikepdf
+    except ImportError:
+        return removed
+    with pikepdf.open(output_path, allow_overwriting_input=True) as pdf:
+        pdf.save(output_path, linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+    return removed
+
+
+class SlimCache:
+    """Slimmed renditions of PDFs (see slim_pdf), made once per document content.
+
+    A rendition is keyed by the source's content hash and lives in
+    ``directory``, a FileCache: when renditions exceed ``max_bytes`` the least
+    recently used are deleted, and ``locks`` (a DocumentLocks) makes one
+    thread or worker process slim a document while the others wait for it.
+    When slimming doesn't make the file smaller, an empty marker records that
+    the original is to be sent, so the work isn't repeated on every request.
+    A failure leaves no marker and is retried next time.
+    """
+
+    def __init__(self, directory, max_bytes, locks, min_text_chars=100):
+        self.files = FileCache(directory, max_bytes, locks, "slim")
+        self.min_text_chars = min_text_chars
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "slimmed": 0, "unchanged": 0, "failures": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def read(self, source_path, source_sha256):
+        """Bytes of the slimmed rendition, made first if needed, or None when the source is to be sent as is.
+
+        The rendition is read while its lock is held, so eviction can't delete it in between.
+        """
+        name, marker = f"{source_sha256}.pdf", f"{source_sha256}.unchanged"
+        with self.files.hold(name):
+            path = self.files.lookup(name)
+            if path or self.files.lookup(marker):
+                with self._lock:
+                    self._stats["hits"] += 1
+                return pathlib.Path(path).read_bytes() if path else None
+            data = self._slim(source_path, name, marker)
+        if data is not None:
+            self.files.evict(keep=name)
+        return data
+
+    def _slim(self, source_path, name, marker):
+        """Slim source_path into the rendition name, or leave a marker when that doesn't help; returns its bytes"""
+        os.makedirs(self.files.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.files.directory, prefix=".slim-", suffix=".part")
+        os.close(fd)
+        source_size = os.path.getsize(source_path)
+        data = None
+        try:
+            try:
+                slim_pdf(source_path, tmp_path, self.min_text_chars)
+            except Exception as e:
+                print(f"⚠️ Could not slim {os.path.basename(source_path)}, sending it as is: {e}")
+                with self._lock:
+                    self._stats["failures"] += 1
+                return None
+
+            if os.path.getsize(tmp_path) < source_size:
+                data = pathlib.Path(tmp_path).read_bytes()
+                os.replace(tmp_path, self.files.path(name))
+            else:
+                open(self.files.path(marker), "wb").close()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._stats["slimmed" if data is not None else "unchanged"] += 1
+            self._stats["bytes_in"] += source_size
+            self._stats["bytes_out"] += len(data) if data is not None else source_size
+        return data
+
+    def stats(self):
+        usage = self.files.usage(suffix=".pdf")
+        with self._lock:
+            return {
+                **self._stats,
+                "evictions": usage["evictions"],
+                "renditions": usage["files"],
+                "bytes": usage["bytes"],
+                "max_bytes": usage["max_bytes"],
+            }
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+
+class Quota:
+    """Limits for one directory; 0 or None means no limit"""
+
+    def __init__(self, max_bytes=None, max_files=None, max_age_seconds=None):
+        self.max_bytes = max_bytes or None
+        self.max_files = max_files or None
+        self.max_age_seconds = max_age_seconds or None
+
+    def to_dict(self):
+        return {"max_bytes": self.max_bytes, "max_files": self.max_files, "max_age_seconds": self.max_age_seconds}
+
+
+class StorageManager:
+    """Keeps pdf/ and audio/ within their quotas.
+
+    Compaction first deletes artifacts older than the age limit, then the least
+    recently accessed ones until the directory is within its byte and file
+    limits. Documents returned by ``pinned()`` (and their audio books) are
+    never deleted. Neither are those in use elsewhere: ``hold_if_free(doc_id)``
+    returns a context manager that yields whether the document's lock could be
+    taken, and the artifact is deleted while holding it, so work in flight, in
+    this process or another, keeps its files.
+    """
+
+    def __init__(self, catalog, pdf_quota, audio_quota, pinned=lambda: set(),
+                 hold_if_free=lambda doc_id: nullcontext(True)):
+        self.catalog = catalog
+        self.quotas = {"pdf": pdf_quota, "audio": audio_quota}
+        self.pinned = pinned
+        self.hold_if_free = hold_if_free
+        self._lock = threading.Lock()
+        self._stats = {"compactions": 0, "evicted_files": 0, "evicted_bytes": 0, "last_compaction": None}
+        self._worker = None
+        self._stop = threading.Event()
+
+    def _artifacts(self):
+        """Catalog entries of each directory as (key, path, size, created, accessed, document id)"""
+        return {
+            "pdf": [
+                (doc["id"], doc["path"], doc["size_bytes"], doc["uploaded_at"], doc["accessed_at"], doc["id"])
+                for doc in self.catalog.documents()
+            ],
+            "audio": [
+                (audio["filename"], audio["path"], audio["size_bytes"], audio["created_at"], audio["accessed_at"],
+                 audio["document_id"])
+                for audio in self.catalog.audio_files()
+            ],
+        }
+
+    def usage(self):
+        """Bytes, file count and age of each directory next to its quota"""
+        now = time.time()
+        usage = {}
+        for kind, artifacts in self._artifacts().items():
+            usage[kind] = {
+                "bytes": sum(size for _, _, size, _, _, _ in artifacts),
+                "files": len(artifacts),
+                "oldest_age_seconds": round(now - min((created for _, _, _, created, _, _ in artifacts), default=now)),
+                "quota": self.quotas[kind].to_dict(),
+            }
+        return {**usage, **self.stats()}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def compact(self):
+        """Evict artifacts until every directory is within its quota; returns what was deleted"""
+        with self._lock:
+            pinned = set(self.pinned())
+            now = time.time()
+            evicted = []
+            for kind, artifacts in self._artifacts().items():
+                quota = self.quotas[kind]
+                total_bytes = sum(size for _, _, size, _, _, _ in artifacts)
+                total_files = len(artifacts)
+
+                for key, path, size, created, accessed, doc_id in sorted(artifacts, key=lambda item: item[4]):
+                    too_old = quota.max_age_seconds is not None and now - created > quota.max_age_seconds
+                    over_bytes = quota.max_bytes is not None and total_bytes > quota.max_bytes
+                    over_files = quota.max_files is not None and total_files > quota.max_files
+                    if not (too_old or over_bytes or over_files) or doc_id in pinned:
+                        continue
+                    with self.hold_if_free(doc_id) if doc_id is not None else nullcontext(True) as free:
+                        deleted = free and self._delete(kind, key, path)
+                    if deleted:
+                        total_bytes -= size
+                        total_files -= 1
+                        evicted.append({"kind": kind, "id": key, "bytes": size, "reason": (
+                            "age" if too_old else "bytes" if over_bytes else "files"
+                        )})
+
+            self._stats["compactions"] += 1
+            self._stats["evicted_files"] += len(evicted)
+            self._stats["evicted_bytes"] += sum(item["bytes"] for item in evicted)
+            self._stats["last_compaction"] = now
+            return evicted
+
+    def _delete(self, kind, key, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ Could not delete {path}: {e}")
+            return False
+        if kind == "pdf":
+            self.catalog.remove_document(key)
+        else:
+            self.catalog.remove_audio(key)
+        return True
+
+    def start(self, interval):
+        """Compact every interval seconds in a background thread"""
+        if self._worker or interval <= 0:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    evicted = self.compact()
+                    if evicted:
+                        print(f"🧹 Evicted {len(evicted)} files to stay within storage quotas")
+                except Exception as e:
+                    print(f"⚠️ Error compacting storage: {e}")
+
+        self._worker = threading.Thread(target=run, name="storage-gc", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        if self._worker:
+            self._stop.set()
+            self._worker.join(timeout=1)
+            self._worker = None
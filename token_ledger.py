@@ -0,0 +1,260 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from db import connect
+
+
+def _empty_counts():
+    return {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "requests": 0}
+
+
+def _add_counts(counts, input_tokens, output_tokens, requests=1):
+    counts["input_tokens"] += input_tokens
+    counts["output_tokens"] += output_tokens
+    counts["total_tokens"] += input_tokens + output_tokens
+    counts["requests"] += requests
+
+
+class TokenLedger:
+    """Write-behind accounting of Gemini token usage, shared by every worker process.
+
+    Each call is added to in-memory pending increments, which are flushed to
+    SQLite in batches, either every ``flush_interval`` seconds or as soon as
+    ``flush_threshold`` calls have accumulated. Flushes are additive
+    ``INSERT ... ON CONFLICT DO UPDATE`` upserts, so workers writing to the
+    same database never overwrite each other's counts. Every flush also
+    re-reads the totals; reads are answered from those totals plus this
+    process's own unflushed increments, so the other workers' usage shows up
+    within one flush interval.
+    """
+
+    def __init__(self, db_path, flush_interval=5.0, flush_threshold=50):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        # Totals in the database as of the last flush
+        self._daily = defaultdict(_empty_counts)
+        self._breakdown = defaultdict(_empty_counts)
+        # Increments not written yet, and those being written by a flush right now
+        self._pending_daily = defaultdict(_empty_counts)
+        self._pending_breakdown = defaultdict(_empty_counts)
+        self._pending_calls = 0
+        self._flushing_daily = {}
+        self._flushing_breakdown = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+        self._conn = connect(db_path)
+        self._init_schema()
+        self._daily, self._breakdown = self._read_totals()
+
+    def _init_schema(self):
+        cursor = self._conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS token_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                total_tokens INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Older databases may hold several rows for one day; merge them so the date can be unique
+        duplicates = cursor.execute(
+            "SELECT date FROM token_usage GROUP BY date HAVING COUNT(*) > 1"
+        ).fetchall()
+        for (date,) in duplicates:
+            cursor.execute("""
+                UPDATE token_usage SET
+                    input_tokens = (SELECT SUM(input_tokens) FROM token_usage WHERE date = ?),
+                    output_tokens = (SELECT SUM(output_tokens) FROM token_usage WHERE date = ?),
+                    total_tokens = (SELECT SUM(total_tokens) FROM token_usage WHERE date = ?)
+                WHERE id = (SELECT MIN(id) FROM token_usage WHERE date = ?)
+            """, (date, date, date, date))
+            cursor.execute("""
+                DELETE FROM token_usage
+                WHERE date = ? AND id != (SELECT MIN(id) FROM token_usage WHERE date = ?)
+            """, (date, date))
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_token_usage_date ON token_usage(date)")
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS token_usage_breakdown (
+                date TEXT NOT NULL,
+                model TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                total_tokens INTEGER DEFAULT 0,
+                requests INTEGER DEFAULT 0,
+                PRIMARY KEY (date, model, endpoint)
+            )
+        ''')
+        self._conn.commit()
+
+    def _read_totals(self):
+        """Daily and breakdown totals currently in the database (written by every worker)"""
+        daily = defaultdict(_empty_counts)
+        breakdown = defaultdict(_empty_counts)
+        for date, input_tokens, output_tokens, total_tokens in self._conn.execute(
+            "SELECT date, input_tokens, output_tokens, total_tokens FROM token_usage"
+        ):
+            daily[date].update(input_tokens=input_tokens, output_tokens=output_tokens, total_tokens=total_tokens)
+        for row in self._conn.execute("""
+            SELECT date, model, endpoint, input_tokens, output_tokens, total_tokens, requests
+            FROM token_usage_breakdown
+        """):
+            date, model, endpoint, input_tokens, output_tokens, total_tokens, requests = row
+            breakdown[(date, model, endpoint)].update(
+                input_tokens=input_tokens, output_tokens=output_tokens,
+                total_tokens=total_tokens, requests=requests
+            )
+        return daily, breakdown
+
+    def _combined(self, totals, *increments):
+        """Database totals plus this process's increments that aren't in them yet"""
+        combined = defaultdict(_empty_counts)
+        for source in (totals, *increments):
+            for key, c in source.items():
+                counts = combined[key]
+                for name in ("input_tokens", "output_tokens", "total_tokens", "requests"):
+                    counts[name] += c[name]
+        return combined
+
+    def record(self, input_tokens=0, output_tokens=0, model="unknown", endpoint="unknown"):
+        """Account for one Gemini call"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            _add_counts(self._pending_daily[today], input_tokens, output_tokens)
+            _add_counts(self._pending_breakdown[(today, model, endpoint)], input_tokens, output_tokens)
+            self._pending_calls += 1
+            if self._pending_calls >= self.flush_threshold:
+                self._wake.set()
+
+    def flush(self):
+        """Write accumulated increments to the database and pick up the other workers' totals"""
+        with self._db_lock:
+            with self._lock:
+                pending_daily, self._pending_daily = self._pending_daily, defaultdict(_empty_counts)
+                pending_breakdown, self._pending_breakdown = self._pending_breakdown, defaultdict(_empty_counts)
+                self._flushing_daily, self._flushing_breakdown = pending_daily, pending_breakdown
+                self._pending_calls = 0
+
+            try:
+                with self._conn:
+                    self._conn.executemany("""
+                        INSERT INTO token_usage (date, input_tokens, output_tokens, total_tokens)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(date) DO UPDATE SET
+                            input_tokens = input_tokens + excluded.input_tokens,
+                            output_tokens = output_tokens + excluded.output_tokens,
+                            total_tokens = total_tokens + excluded.total_tokens
+                    """, [
+                        (date, c["input_tokens"], c["output_tokens"], c["total_tokens"])
+                        for date, c in pending_daily.items()
+                    ])
+                    self._conn.executemany("""
+                        INSERT INTO token_usage_breakdown
+                            (date, model, endpoint, input_tokens, output_tokens, total_tokens, requests)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(date, model, endpoint) DO UPDATE SET
+                            input_tokens = input_tokens + excluded.input_tokens,
+                            output_tokens = output_tokens + excluded.output_tokens,
+                            total_tokens = total_tokens + excluded.total_tokens,
+                            requests = requests + excluded.requests
+                    """, [
+                        (date, model, endpoint, c["input_tokens"], c["output_tokens"], c["total_tokens"], c["requests"])
+                        for (date, model, endpoint), c in pending_breakdown.items()
+                    ])
+                daily, breakdown = self._read_totals()
+            except Exception as e:
+                print(f"⚠️ Error flushing token usage: {e}")
+                # Put the increments back so they are retried on the next flush
+                with self._lock:
+                    for date, c in pending_daily.items():
+                        _add_counts(self._pending_daily[date], c["input_tokens"], c["output_tokens"], c["requests"])
+                    for key, c in pending_breakdown.items():
+                        _add_counts(self._pending_breakdown[key], c["input_tokens"], c["output_tokens"], c["requests"])
+                    self._pending_calls += 1
+                    self._flushing_daily, self._flushing_breakdown = {}, {}
+                return
+
+            with self._lock:
+                self._daily, self._breakdown = daily, breakdown
+                self._flushing_daily, self._flushing_breakdown = {}, {}
+
+    def start(self):
+        """Start the background flusher"""
+        if self._flusher:
+            return
+        self._stopped.clear()
+
+        def run():
+            while not self._stopped.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self.flush()
+
+        self._flusher = threading.Thread(target=run, name="token-ledger-flush", daemon=True)
+        self._flusher.start()
+
+    def running(self):
+        """Whether the background flusher is alive"""
+        return self._flusher is not None and self._flusher.is_alive()
+
+    def stop(self):
+        """Stop the background flusher and write everything still pending"""
+        if self._flusher:
+            self._stopped.set()
+            self._wake.set()
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+
+    def today(self):
+        """Today's token usage"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            counts = self._combined(self._daily, self._flushing_daily, self._pending_daily)[today]
+            return {
+                "date": today,
+                "input_tokens": counts["input_tokens"],
+                "output_tokens": counts["output_tokens"],
+                "total_tokens": counts["total_tokens"]
+            }
+
+    def history(self, days=7):
+        """Daily token usage for the last N days, newest first"""
+        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        with self._lock:
+            return [
+                {
+                    "date": date,
+                    "input_tokens": counts["input_tokens"],
+                    "output_tokens": counts["output_tokens"],
+                    "total_tokens": counts["total_tokens"]
+                }
+                for date, counts in sorted(
+                    self._combined(self._daily, self._flushing_daily, self._pending_daily).items(), reverse=True
+                )
+                if date >= start_date
+            ]
+
+    def breakdown(self, days=7):
+        """Token usage for the last N days split by model and by endpoint"""
+        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        by_model = defaultdict(_empty_counts)
+        by_endpoint = defaultdict(_empty_counts)
+        with self._lock:
+            breakdown = self._combined(self._breakdown, self._flushing_breakdown, self._pending_breakdown)
+            for (date, model, endpoint), c in breakdown.items():
+                if date < start_date:
+                    continue
+                _add_counts(by_model[model], c["input_tokens"], c["output_tokens"], c["requests"])
+                _add_counts(by_endpoint[endpoint], c["input_tokens"], c["output_tokens"], c["requests"])
+        return {"by_model": dict(by_model), "by_endpoint": dict(by_endpoint)}
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from fastapi.concurrency import run_in_threadpool
+
+from file_cache import FileCache
+
+# Output formats: file extension, media type and the ffmpeg arguments of a mono speech profile
+FORMATS = {
+    "mp3": {"ext": "mp3", "media_type": "audio/mpeg", "args": ["-c:a", "libmp3lame", "-f", "mp3"]},
+    "opus": {"ext": "opus", "media_type": "audio/ogg", "args": ["-c:a", "libopus", "-application", "voip", "-f", "ogg"]},
+    "aac": {"ext": "m4a", "media_type": "audio/mp4", "args": ["-c:a", "aac", "-profile:a", "aac_low", "-f", "mp4",
+                                                            "-movflags", "+faststart"]},
+}
+
+# Media types a client may list in Accept for each format
+ACCEPT_TYPES = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "application/ogg": "opus",
+    "audio/mp4": "aac",
+    "audio/aac": "aac",
+    "audio/x-m4a": "aac",
+}
+
+_BITRATE = re.compile(r'^(\d{1,3})k$')
+
+
+class TranscodeError(Exception):
+    """ffmpeg is missing or failed to produce a rendition"""
+
+
+def valid_bitrate(bitrate):
+    """Whether bitrate looks like "24k" and is between 6k and 320k"""
+    match = _BITRATE.match(bitrate or "")
+    return bool(match) and 6 <= int(match.group(1)) <= 320
+
+
+def negotiate_format(accept, formats=FORMATS, preferred="mp3"):
+    """Pick the output format, among ``formats``, for an Accept header.
+
+    ``preferred`` wins whenever the client accepts it, by name or through
+    ``audio/*`` or ``*/*``. Otherwise the acceptable format with the highest
+    quality is picked, the client's order breaking ties; if none is acceptable
+    (or there is no Accept header) ``preferred`` is returned anyway.
+    """
+    named, wildcards = {}, {}
+    for part in (accept or "").split(","):
+        media_type, *params = (piece.strip() for piece in part.split(";"))
+        media_type = media_type.lower()
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ("audio/*", "*/*"):
+            wildcards[media_type] = max(q, wildcards.get(media_type, 0.0))
+        elif ACCEPT_TYPES.get(media_type) in formats:
+            fmt = ACCEPT_TYPES[media_type]
+            named[fmt] = max(q, named.get(fmt, 0.0))
+
+    # A format named in the header gets its own quality, any other the most specific wildcard's
+    wildcard_q = wildcards.get("audio/*", wildcards.get("*/*", 0.0))
+    quality = {fmt: named.get(fmt, wildcard_q) for fmt in formats}
+    if quality.get(preferred, 0.0) > 0:
+        return preferred
+    best, best_q = preferred, 0.0
+    for fmt in [*named, *formats]:
+        if quality[fmt] > best_q:
+            best, best_q = fmt, quality[fmt]
+    return best
+
+
+class RenditionCache:
+    """Transcoded renditions of audio books, produced on demand by ffmpeg.
+
+    A rendition is keyed by the source file's content hash, format and bitrate,
+    so it is made once and reused until the book changes. Renditions live in
+    ``directory``, a FileCache: when they exceed ``max_bytes`` the least
+    recently used are deleted, and ``locks`` (a DocumentLocks) keeps two
+    requests or worker processes from transcoding the same rendition at once.
+    Requests waiting for a transcode don't hold a worker thread.
+    """
+
+    def __init__(self, directory, max_bytes, locks, ffmpeg="ffmpeg", timeout=3600):
+        self.files = FileCache(directory, max_bytes, locks, "rendition")
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "transcodes": 0, "failures": 0}
+        self._preparing = {}
+
+    def available(self):
+        return shutil.which(self.ffmpeg) is not None
+
+    def _name(self, source_sha256, fmt, bitrate):
+        return f"{source_sha256}_{bitrate}.{FORMATS[fmt]['ext']}"
+
+    def cached(self, source_sha256, fmt, bitrate):
+        """Path of the rendition if it is already made, else None; never waits or transcodes"""
+        path = self.files.lookup(self._name(source_sha256, fmt, bitrate))
+        if path:
+            with self._lock:
+                self._stats["hits"] += 1
+        return path
+
+    async def get(self, source_path, source_sha256, fmt, bitrate):
+        """Path of the rendition, transcoding it first if it isn't cached yet"""
+        name = self._name(source_sha256, fmt, bitrate)
+
+        # One transcode per rendition; concurrent requests for it, in any process, wait and then reuse the file
+        async with self.files.hold_async(name):
+            path = self.files.lookup(name)
+            if path:
+                with self._lock:
+                    self._stats["hits"] += 1
+                return path
+            if not self.available():
+                raise TranscodeError("ffmpeg is not installed on this server")
+            path = self.files.path(name)
+            await run_in_threadpool(self._transcode, source_path, path, fmt, bitrate)
+
+        with self._lock:
+            self._stats["transcodes"] += 1
+        await run_in_threadpool(self.files.evict, name)
+        return path
+
+    def prepare(self, source_path, source_sha256, fmt, bitrate):
+        """Start making the rendition in the background, unless this process already is"""
+        name = self._name(source_sha256, fmt, bitrate)
+        if name in self._preparing:
+            return
+
+        async def make():
+            try:
+                await self.get(source_path, source_sha256, fmt, bitrate)
+            except Exception as e:
+                print(f"⚠️ Could not prepare the {fmt} rendition of {os.path.basename(source_path)}: {e}")
+            finally:
+                self._preparing.pop(name, None)
+
+        self._preparing[name] = asyncio.ensure_future(make())
+
+    def _transcode(self, source_path, path, fmt, bitrate):
+        os.makedirs(self.files.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.files.directory, prefix=".rendition-", suffix=".part")
+        os.close(fd)
+        try:
+            result = subprocess.run(
+                [self.ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", source_path, "-vn", "-ac", "1",
+                 "-b:a", bitrate, *FORMATS[fmt]["args"], tmp_path],
+                capture_output=True,
+                timeout=self.timeout
+            )
+            if result.returncode != 0:
+                error = result.stderr.decode(errors="replace").strip().splitlines()
+                with self._lock:
+                    self._stats["failures"] += 1
+                raise TranscodeError(f"ffmpeg exited with {result.returncode}: {error[-1] if error else ''}")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        usage = self.files.usage()
+        with self._lock:
+            return {
+                **self._stats,
+                "evictions": usage["evictions"],
+                "renditions": usage["files"],
+                "bytes": usage["bytes"],
+                "max_bytes": usage["max_bytes"],
+            }
@@ -0,0 +1,462 @@
+import hashlib
+import io
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from segments import segment_key
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_text(text, max_chars=800):
+    """Split text into chunks of at most max_chars, breaking at paragraph or sentence boundaries.
+
+    A single sentence longer than max_chars is split at the last space that fits.
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        sentences = [paragraph] if len(paragraph) <= max_chars else _SENTENCE_END.split(paragraph)
+        starts_paragraph = True
+        for sentence in sentences:
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append((sentence[:cut].strip(), starts_paragraph))
+                sentence = sentence[cut:].strip()
+                starts_paragraph = False
+            pieces.append((sentence, starts_paragraph))
+            starts_paragraph = False
+
+    chunks = []
+    current = ""
+    for piece, starts_paragraph in pieces:
+        separator = "\n\n" if starts_paragraph else " "
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_segments(text, max_chars=800):
+    """Split text like split_text, but never join paragraphs.
+
+    Segment boundaries then depend only on each paragraph's own text, so an
+    edit to one paragraph leaves the segments of the others unchanged.
+    """
+    segments = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        segments.extend(split_text(paragraph, max_chars))
+    return segments
+
+
+class ParagraphBuffer:
+    """Collects streamed text and hands out each paragraph once it is complete"""
+
+    def __init__(self):
+        self._text = ""
+
+    def feed(self, text):
+        """Add text; returns the paragraphs it completed"""
+        self._text += text
+        parts = re.split(r'\n\s*\n', self._text)
+        self._text = parts.pop()
+        return [part.strip() for part in parts if part.strip()]
+
+    def flush(self):
+        """The last, unterminated paragraph, once the text is complete"""
+        rest, self._text = self._text.strip(), ""
+        return [rest] if rest else []
+
+
+def strip_id3(data):
+    """Drop a leading ID3v2 tag so MP3 chunks can be joined frame-to-frame"""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return data[10 + size + footer:]
+    return data
+
+
+class GTTSEngine:
+    """Google Text-to-Speech, one HTTP round trip per chunk"""
+
+    name = "gtts"
+    voice = "gtts"
+
+    def __init__(self, workers=4):
+        self.workers = workers
+
+    def available(self):
+        return True
+
+    def synthesize(self, text, lang='en'):
+        """Synthesize text to MP3 bytes"""
+        # Imported on first use: gtts pulls in requests, which slows down startup
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=False).write_to_fp(buffer)
+        return strip_id3(buffer.getvalue())
+
+
+class LocalEngine:
+    """Offline engine: a local command renders WAV, which ffmpeg encodes to MP3.
+
+    ``command`` is an argument list where ``{wav}`` and ``{lang}`` are filled in;
+    the text is sent on stdin. Each chunk runs in its own subprocesses, so
+    chunks are synthesized in parallel across CPU cores. Every chunk is encoded
+    at the same sample rate and bitrate without ID3 or Xing headers so chunks
+    can be joined frame-to-frame like gTTS output.
+    """
+
+    def __init__(self, name, command, workers=None, ffmpeg="ffmpeg", bitrate="64k", sample_rate=22050, timeout=120):
+        self.name = name
+        self.command = command
+        self.workers = workers or os.cpu_count() or 2
+        self.ffmpeg = ffmpeg
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        # Everything that changes the audio, so stored segments are only reused for identical settings
+        self.voice = f"{name}:{' '.join(command)}:{bitrate}:{sample_rate}"
+
+    def available(self):
+        return bool(shutil.which(self.command[0]) and shutil.which(self.ffmpeg))
+
+    def _run(self, args, data=None):
+        result = subprocess.run(args, input=data, capture_output=True, timeout=self.timeout)
+        if result.returncode != 0:
+            error = result.stderr.decode(errors="replace").strip().splitlines()
+            raise RuntimeError(f"{os.path.basename(args[0])} exited with {result.returncode}: {error[-1] if error else ''}")
+        return result.stdout
+
+    def synthesize(self, text, lang='en'):
+        """Synthesize text to MP3 bytes"""
+        fd, wav_path = tempfile.mkstemp(prefix=".tts-", suffix=".wav")
+        os.close(fd)
+        try:
+            self._run([arg.format(wav=wav_path, lang=lang) for arg in self.command], text.encode())
+            return self._run([
+                self.ffmpeg, "-nostdin", "-loglevel", "error", "-i", wav_path,
+                "-ac", "1", "-ar", str(self.sample_rate), "-codec:a", "libmp3lame", "-b:a", self.bitrate,
+                "-id3v2_version", "0", "-write_xing", "0", "-f", "mp3", "pipe:1"
+            ])
+        finally:
+            os.remove(wav_path)
+
+
+def espeak_engine(workers=None, voice=None, **kwargs):
+    """espeak-ng engine; ``voice`` overrides the voice picked from the language"""
+    return LocalEngine("espeak", ["espeak-ng", "-v", voice or "{lang}", "--stdin", "-w", "{wav}"], workers, **kwargs)
+
+
+def piper_engine(model, workers=None, piper="piper", **kwargs):
+    """Piper neural engine using the given .onnx voice model"""
+    return LocalEngine("piper", [piper, "--model", model, "--output_file", "{wav}"], workers, **kwargs)
+
+
+DEFAULT_ENGINE = GTTSEngine()
+
+
+def synthesize_chunk(text, lang='en', retries=3, backoff=0.5, engine=None, store=None):
+    """Synthesize one chunk of text to MP3 bytes, retrying just this chunk on failure.
+
+    With a segment ``store`` the chunk is looked up by content first and stored
+    after synthesis. Returns ``(data, reused)``.
+    """
+    engine = engine or DEFAULT_ENGINE
+    key = None
+    if store is not None:
+        key = segment_key(text, lang, engine.voice)
+        data = store.get(key)
+        if data is not None:
+            return data, True
+
+    for attempt in range(retries + 1):
+        try:
+            data = engine.synthesize(text, lang)
+            if store is not None:
+                try:
+                    store.put(key, data)
+                except Exception as e:
+                    print(f"⚠️ Could not store TTS segment: {e}")
+            return data, False
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"⚠️ TTS chunk failed ({e}), retrying ({attempt + 1}/{retries})")
+            time.sleep(backoff * (2 ** attempt))
+
+
+def synthesize_chunks(chunks, lang='en', workers=4, retries=3, engine=None, store=None):
+    """Synthesize chunks concurrently and yield ``(data, reused)`` for each in the original order.
+
+    ``chunks`` may be a lazy iterable, such as paragraphs of a summary that is
+    still being generated: each chunk is submitted as soon as it is produced.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tts") as executor:
+        pending = queue.Queue()
+        submitted = []
+        stop = threading.Event()
+
+        def feed():
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    future = executor.submit(synthesize_chunk, chunk, lang, retries, engine=engine, store=store)
+                    submitted.append(future)
+                    pending.put(future)
+            except Exception as e:
+                pending.put(e)
+            finally:
+                pending.put(None)
+
+        threading.Thread(target=feed, name="tts-feeder", daemon=True).start()
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item.result()
+        finally:
+            stop.set()
+            for future in submitted:
+                future.cancel()
+
+
+def synthesize_to_file(text, path, lang='en', workers=4, chunk_chars=800, retries=3, on_chunk=None, engine=None,
+                       store=None):
+    """Synthesize text to an MP3 at path with ``engine`` (gTTS by default), stitching chunk outputs without re-encoding.
+
+    ``text`` is a string, or an iterable of paragraphs that may still be arriving
+    (synthesis of each starts as soon as it does). The file is written under a
+    temporary name and moved into place once every chunk has been synthesized.
+    ``on_chunk(data)``, if given, receives each chunk's MP3 bytes in order as
+    soon as it is ready. With a segment ``store`` the text is split per
+    paragraph and only segments missing from the store are synthesized.
+    Returns the number of chunks and how many were reused, the bytes written,
+    their SHA-256 and the seconds spent writing them.
+    """
+    if not isinstance(text, str):
+        chunks = (chunk for paragraph in text for chunk in split_segments(paragraph, chunk_chars))
+    elif store is not None:
+        chunks = split_segments(text, chunk_chars)
+    else:
+        chunks = split_text(text, chunk_chars)
+    digest = hashlib.sha256()
+    chunk_count = 0
+    reused_chunks = 0
+    written = 0
+    write_seconds = 0.0
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tts-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for data, reused in synthesize_chunks(chunks, lang, workers, retries, engine, store):
+                chunk_count += 1
+                reused_chunks += reused
+                started = time.perf_counter()
+                out.write(data)
+                write_seconds += time.perf_counter() - started
+                digest.update(data)
+                written += len(data)
+                if on_chunk:
+                    on_chunk(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {
+        "chunks": chunk_count,
+        "reused": reused_chunks,
+        "bytes": written,
+        "sha256": digest.hexdigest(),
+        "write_seconds": write_seconds
+    }
+
+
+def _live_paths(directory, audio_file):
+    base = os.path.join(directory, f".live-{os.path.basename(audio_file)}")
+    return base + ".part", base + ".done"
+
+
+def _abandoned(fd):
+    """Whether no LiveAudio holds the open live file any more, i.e. its writer's process died"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    return True
+
+
+class LiveAudio:
+    """MP3 of a book that is still being synthesized, readable from every worker process.
+
+    The synthesis thread appends chunks in order to ``.live-<audio_file>.part``
+    in directory, and any number of listeners, in this process or another,
+    read it from the start while later chunks are still being produced (see
+    LiveAudioReader). The writer holds a shared flock on the file, so readers
+    notice a writer that died. When synthesis ends a ``.done`` marker records
+    the outcome and the partial file is deleted; readers that already have it
+    open read on to its end. Markers older than MARKER_MAX_AGE_SECONDS are
+    deleted when the next synthesis starts.
+    """
+
+    MARKER_MAX_AGE_SECONDS = 3600
+
+    def __init__(self, directory, audio_file):
+        self.audio_file = audio_file
+        self.path, self.marker = _live_paths(directory, audio_file)
+        os.makedirs(directory, exist_ok=True)
+        for stale in (self.marker, self.path):
+            if os.path.exists(stale):
+                os.remove(stale)
+        self._remove_old_markers(directory)
+        # Lock the file before it appears under its name, so no reader sees it unlocked
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".live-", suffix=".tmp")
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+        self._out = os.fdopen(fd, "wb")
+        os.replace(tmp_path, self.path)
+        self._inode = os.fstat(fd).st_ino
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _remove_old_markers(cls, directory):
+        """Delete the markers of syntheses that ended long ago, whose listeners are all done"""
+        cutoff = time.time() - cls.MARKER_MAX_AGE_SECONDS
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".live-") and entry.name.endswith(".done"):
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def append(self, data):
+        with self._lock:
+            self._out.write(data)
+            self._out.flush()
+
+    def finish(self, error=None):
+        with self._lock:
+            if self._out.closed:
+                return
+            # The marker goes down while the flock is still held, so readers never take this for a crash
+            try:
+                if os.stat(self.path).st_ino == self._inode:
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".live-", suffix=".tmp")
+                    with os.fdopen(fd, "w") as out:
+                        out.write(str(error) if error else "")
+                    os.replace(tmp_path, self.marker)
+                    os.remove(self.path)
+            except FileNotFoundError:
+                # A newer synthesis of the book has taken over the name
+                pass
+            except OSError:
+                # Windows can't delete a file that listeners have open; the marker still ends their streams
+                pass
+            finally:
+                self._out.close()
+
+
+class LiveAudioReader:
+    """Reads a book that is being synthesized (see LiveAudio) from its first chunk"""
+
+    def __init__(self, path, marker, audio_file):
+        self.audio_file = audio_file
+        self.marker = marker
+        self._file = open(path, "rb")
+
+    @classmethod
+    def open(cls, directory, audio_file):
+        """A reader of the live book, or None if it isn't being synthesized"""
+        path, marker = _live_paths(directory, audio_file)
+        if os.path.exists(marker):
+            return None
+        try:
+            reader = cls(path, marker, audio_file)
+        except FileNotFoundError:
+            return None
+        if _abandoned(reader._file.fileno()):
+            # Left behind by a worker that died mid-synthesis
+            reader.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return reader
+
+    def read(self):
+        """Return the bytes written since the last read, whether synthesis is over, and any error"""
+        data = self._file.read()
+        if data:
+            return data, False, None
+        finished, error = self._finished()
+        if finished:
+            # Whatever was written before the writer finished
+            return self._file.read(), True, error
+        return b"", False, None
+
+    def _finished(self):
+        fd = self._file.fileno()
+        if os.path.exists(self.marker):
+            with open(self.marker) as f:
+                return True, f.read() or None
+        if os.fstat(fd).st_nlink == 0:
+            # Deleted without a marker: a newer synthesis of the book replaced this one
+            return True, "superseded by a newer synthesis"
+        if _abandoned(fd):
+            return True, "the synthesizing process stopped"
+        return False, None
+
+    def close(self):
+        self._file.close()
+
+
+def live_audio_files(directory):
+    """Audio filenames of the books being synthesized, most recently written first"""
+    live = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not (entry.name.startswith(".live-") and entry.name.endswith(".part")):
+                    continue
+                try:
+                    with open(entry.path, "rb") as f:
+                        if _abandoned(f.fileno()):
+                            continue
+                        live.append((os.fstat(f.fileno()).st_mtime, entry.name[len(".live-"):-len(".part")]))
+                except FileNotFoundError:
+                    pass
+    except FileNotFoundError:
+        return []
+    return [
+        audio_file for _, audio_file in sorted(live, reverse=True)
+        if not os.path.exists(_live_paths(directory, audio_file)[1])
+    ]
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import tempfile
+
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Allowance for the multipart boundaries and part headers around an uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the configured maximum size"""
+
+
+class InvalidUpload(Exception):
+    """The request body isn't a well-formed multipart upload"""
+
+
+def _write_chunk(out, digest, chunk):
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _finish_file(out):
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+
+def _too_large(max_bytes):
+    return UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+
+
+def check_content_length(request, max_bytes):
+    """Raise UploadTooLarge before reading the body if its declared length can't fit one file of max_bytes"""
+    try:
+        length = int(request.headers.get("content-length", ""))
+    except ValueError:
+        return
+    if length > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise _too_large(max_bytes)
+
+
+class ReceivedFile:
+    """A file part of an upload: its name and type, and where it was stored (``path`` is None if it wasn't)"""
+
+    def __init__(self, filename, content_type):
+        self.filename = filename
+        self.content_type = content_type
+        self.path = None
+        self.sha256 = None
+        self.size = 0
+        self.duplicate = False
+        self.error = None
+
+
+class _ContentAddressedFile:
+    """A temporary file in directory, hashed as it is written and renamed to ``<sha256>.pdf`` when finished"""
+
+    def __init__(self, directory, chunk_size):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        self.out = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+
+    async def write(self, data):
+        self.size += len(data)
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            await self._flush()
+
+    async def _flush(self):
+        if self.buffer:
+            chunk, self.buffer = bytes(self.buffer), bytearray()
+            await run_in_threadpool(_write_chunk, self.out, self.digest, chunk)
+
+    async def finish(self):
+        """Store the file; returns ``(path, sha256, size_bytes, duplicate)``"""
+        try:
+            await self._flush()
+            await run_in_threadpool(_finish_file, self.out)
+            file_hash = self.digest.hexdigest()
+            final_path = os.path.join(self.directory, f"{file_hash}.pdf")
+            duplicate = os.path.exists(final_path)
+            if duplicate:
+                os.utime(final_path)
+            else:
+                os.replace(self.tmp_path, final_path)
+            return final_path, file_hash, self.size, duplicate
+        finally:
+            self.discard()
+
+    def discard(self):
+        if not self.out.closed:
+            self.out.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class _PartEvents:
+    """MultipartParser callbacks that queue each part's headers, data and end for the async side to handle"""
+
+    def __init__(self):
+        self.events = []
+        self._headers = {}
+        self._name = b""
+        self._value = b""
+
+    def callbacks(self):
+        names = ("on_part_begin", "on_header_field", "on_header_value", "on_header_end",
+                 "on_headers_finished", "on_part_data", "on_part_end")
+        return {name: getattr(self, name) for name in names}
+
+    def drain(self):
+        events, self.events = self.events, []
+        return events
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._name.lower()] = self._value
+        self._name = self._value = b""
+
+    def on_headers_finished(self):
+        self.events.append(("headers", self._headers))
+
+    def on_part_data(self, data, start, end):
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        self.events.append(("end", None))
+
+
+async def receive_uploads(request, field, directory, max_bytes, accept=("application/pdf",), chunk_size=1024 * 1024):
+    """Stream the files sent as multipart field ``field`` straight from the request body into directory.
+
+    The body is parsed as it arrives, so each file is written to disk once, in
+    ``chunk_size`` pieces to a temporary file that is hashed on the way and
+    renamed to ``<sha256>.pdf``; an existing file with that hash is marked as
+    the newest upload instead. A file that passes ``max_bytes`` is abandoned
+    as soon as it does. Yields a ReceivedFile for every file part: once it is
+    stored, once it is too large (with ``error`` set; the rest of it is
+    discarded if iteration goes on), or right away, unstored, if its type
+    isn't in ``accept``.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUpload("Expected a multipart/form-data upload")
+
+    events = _PartEvents()
+    parser = MultipartParser(params[b"boundary"], events.callbacks())
+    received = file = None
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise InvalidUpload(f"Malformed multipart upload: {e}") from None
+
+            for kind, value in events.drain():
+                if kind == "headers":
+                    _, options = parse_options_header(value.get(b"content-disposition", b""))
+                    received = None
+                    if options.get(b"name", b"").decode("utf-8", "replace") != field or b"filename" not in options:
+                        continue
+                    received = ReceivedFile(
+                        options[b"filename"].decode("utf-8", "replace"),
+                        value.get(b"content-type", b"").decode("latin-1")
+                    )
+                    if accept and received.content_type not in accept:
+                        yield received
+                        received = None
+                    else:
+                        file = _ContentAddressedFile(directory, chunk_size)
+                elif kind == "data" and file:
+                    if file.size + len(value) > max_bytes:
+                        file.discard()
+                        file = None
+                        received.error = _too_large(max_bytes)
+                        yield received
+                        received = None
+                    else:
+                        await file.write(value)
+                elif kind == "end" and file:
+                    received.path, received.sha256, received.size, received.duplicate = await file.finish()
+                    file = None
+                    yield received
+                    received = None
+        parser.finalize()
+    finally:
+        if file:
+            file.discard()